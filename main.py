@@ -2,13 +2,45 @@ import os
 import tempfile
 import shutil
 import subprocess
-import requests
+import httpx
+import numpy as np
 import json
+import logging
+import logging.handlers
+import hashlib
+import math
+import base64
+import codecs
+import io
 import traceback
 import uuid
+import threading
+import time
+import queue
+import sys
+import zlib
+import asyncio
+import contextvars
+import msgpack
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from opentelemetry import trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.propagate import extract, inject
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from starlette.concurrency import run_in_threadpool
+import ctranslate2
 from faster_whisper import WhisperModel
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.vad import VadOptions, get_speech_timestamps
 
 # ========= ENV =========
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
@@ -18,27 +50,196 @@ PROCESSED_BUCKET = os.environ.get("PROCESSED_BUCKET", "processed")  # unused now
 TRANSCRIPTS_BUCKET = os.environ.get("TRANSCRIPTS_BUCKET", "transcripts")
 API_KEY = os.environ.get("TRANSCRIBE_API_KEY", "changeme")
 WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "medium")
+# Models a request may select with "model" (comma separated); WHISPER_MODEL is always allowed
+WHISPER_MODELS = [m.strip() for m in os.environ.get("WHISPER_MODELS", WHISPER_MODEL).split(",") if m.strip()]
+# Loaded models are kept in an LRU bounded by their estimated memory; idle ones are dropped
+# (WHISPER_MODEL, warmed at startup, always stays loaded)
+MODEL_POOL_MAX_MB = float(os.environ.get("MODEL_POOL_MAX_MB", "4096"))
+MODEL_IDLE_SECONDS = float(os.environ.get("MODEL_IDLE_SECONDS", "1800"))
+# Concurrent transcriptions per model: a default plus name=N overrides, e.g. "2,large-v3=1,tiny=4"
+_model_concurrency = [item.strip() for item in os.environ.get("MODEL_MAX_CONCURRENCY", "2").split(",") if item.strip()]
+MODEL_MAX_CONCURRENCY = next((int(item) for item in _model_concurrency if "=" not in item), 2)
+MODEL_CONCURRENCY = {name.strip(): int(limit) for name, limit in
+                     (item.split("=") for item in _model_concurrency if "=" in item)}
+# Run a short inference on the default model after loading it in the background
+WARMUP = os.environ.get("WARMUP", "1") == "1"
 DEBUG = os.environ.get("DEBUG", "0") == "1"
 LOG_BODY = os.environ.get("LOG_BODY", "0") == "1"
+# Logs are written by a background thread as JSON lines (LOG_FORMAT=text for the old prefixed lines)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG" if DEBUG else "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Fraction of request ids whose below-WARNING records are kept; warnings and errors always are
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+# Pooled keep-alive connections to Supabase storage, retried with backoff on 5xx/connection errors
+STORAGE_POOL_SIZE = int(os.environ.get("STORAGE_POOL_SIZE", "20"))
+STORAGE_RETRIES = int(os.environ.get("STORAGE_RETRIES", "3"))
+STORAGE_BACKOFF = float(os.environ.get("STORAGE_BACKOFF", "0.5"))
+# Downloads resume with Range requests after a dropped connection; objects of at least
+# RANGE_MIN_BYTES are fetched as RANGE_PART_BYTES parts, DOWNLOAD_PARALLEL at a time
+# (such objects skip STREAM_DOWNLOAD, which reads over a single connection while
+# holding a transcription slot)
+DOWNLOAD_RESUME_ATTEMPTS = int(os.environ.get("DOWNLOAD_RESUME_ATTEMPTS", "5"))
+RANGE_MIN_BYTES = int(os.environ.get("RANGE_MIN_BYTES", str(64 * 1024 * 1024)))
+RANGE_PART_BYTES = int(os.environ.get("RANGE_PART_BYTES", str(16 * 1024 * 1024)))
+DOWNLOAD_PARALLEL = int(os.environ.get("DOWNLOAD_PARALLEL", "4"))
+# Uploads of at least TUS_THRESHOLD_BYTES use the resumable (TUS) endpoint in
+# TUS_CHUNK_BYTES pieces (Supabase requires 6 MB); streamed bodies spool to disk past UPLOAD_SPOOL_BYTES
+TUS_THRESHOLD_BYTES = int(os.environ.get("TUS_THRESHOLD_BYTES", str(20 * 1024 * 1024)))
+TUS_CHUNK_BYTES = int(os.environ.get("TUS_CHUNK_BYTES", str(6 * 1024 * 1024)))
+TUS_RESUME_ATTEMPTS = int(os.environ.get("TUS_RESUME_ATTEMPTS", "5"))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+# Decode straight to float32 PCM in memory instead of writing an intermediate WAV
+AUDIO_PIPE = os.environ.get("AUDIO_PIPE", "1") == "1"
+SAMPLE_RATE = 16000
+# Feed the download straight into ffmpeg's stdin (needs AUDIO_PIPE)
+STREAM_DOWNLOAD = os.environ.get("STREAM_DOWNLOAD", "1") == "1"
+# Containers that may keep their index at the end of the file; ffmpeg must seek in those
+SEEK_REQUIRED_EXTS = {".mp4", ".m4a", ".m4v", ".mov", ".3gp"}
+# Parallel chunked transcription: long audio is cut on silence and the chunks are
+# transcribed by PARALLEL_CHUNKS model workers at once (1 disables it)
+PARALLEL_CHUNKS = int(os.environ.get("PARALLEL_CHUNKS", "1"))
+PARALLEL_MIN_SECONDS = float(os.environ.get("PARALLEL_MIN_SECONDS", "600"))
+CHUNK_TARGET_SECONDS = float(os.environ.get("CHUNK_TARGET_SECONDS", "300"))
+# Threads per model worker; 0 splits the cores evenly across PARALLEL_CHUNKS workers
+WHISPER_CPU_THREADS = int(os.environ.get("WHISPER_CPU_THREADS", "0"))
+# Transcript cache keyed by source content hash + model + decode options.
+# Local LRU is bounded by TRANSCRIPT_CACHE_MAX_MB (0 disables the cache);
+# TRANSCRIPT_CACHE_BUCKET=1 also mirrors entries to TRANSCRIPTS_BUCKET/_cache/.
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "transcript-cache")
+TRANSCRIPT_CACHE_MAX_MB = float(os.environ.get("TRANSCRIPT_CACHE_MAX_MB", "512"))
+TRANSCRIPT_CACHE_BUCKET = os.environ.get("TRANSCRIPT_CACHE_BUCKET", "0") == "1"
+# Extra artifacts uploaded next to transcript.json/.txt (comma separated: msgpack, srt, vtt); requests may set "formats"
+TRANSCRIPT_FORMATS = [f.strip() for f in os.environ.get("TRANSCRIPT_FORMATS", "").split(",") if f.strip()]
+# Subtitle cue limits; requests may override them with "subtitles"
+SUBTITLE_MAX_LINE_CHARS = int(os.environ.get("SUBTITLE_MAX_LINE_CHARS", "42"))
+SUBTITLE_MAX_LINES = int(os.environ.get("SUBTITLE_MAX_LINES", "2"))
+SUBTITLE_MAX_CUE_SECONDS = float(os.environ.get("SUBTITLE_MAX_CUE_SECONDS", "6"))
+# Default decoding profile (see DECODE_PROFILES); requests may pick another with "profile"
+DECODE_PROFILE = os.environ.get("DECODE_PROFILE", "accurate")
+# Silero VAD settings used whenever VAD filtering is on (profile or request "vad")
+VAD_THRESHOLD = float(os.environ.get("VAD_THRESHOLD", "0.5"))
+VAD_MIN_SILENCE_MS = int(os.environ.get("VAD_MIN_SILENCE_MS", "2000"))
+VAD_SPEECH_PAD_MS = int(os.environ.get("VAD_SPEECH_PAD_MS", "400"))
+# Cross-request batching: 30 s speech windows from all in-flight jobs are decoded
+# together, up to BATCH_SIZE per call, waiting at most BATCH_MAX_WAIT_MS to fill a batch
+BATCH_INFERENCE = os.environ.get("BATCH_INFERENCE", "0") == "1"
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "50"))
+# Live WebSocket transcription: re-decode the rolling buffer every LIVE_STEP_SECONDS of
+# new audio; segments ending LIVE_COMMIT_MARGIN_SECONDS before the buffer end are final
+LIVE_STEP_SECONDS = float(os.environ.get("LIVE_STEP_SECONDS", "1.0"))
+LIVE_COMMIT_MARGIN_SECONDS = float(os.environ.get("LIVE_COMMIT_MARGIN_SECONDS", "1.5"))
+LIVE_MAX_BUFFER_SECONDS = float(os.environ.get("LIVE_MAX_BUFFER_SECONDS", "20"))
+# Clients that cannot send an X-API-KEY header (browsers) authenticate with a first message
+LIVE_AUTH_TIMEOUT_SECONDS = float(os.environ.get("LIVE_AUTH_TIMEOUT_SECONDS", "10"))
+# Job mode: POST /process returns a job id and the work runs on a background pool
+PROCESS_ASYNC_DEFAULT = os.environ.get("PROCESS_ASYNC_DEFAULT", "0") == "1"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "100"))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "3600"))
+# Admission control: at most TRANSCRIBE_MAX_CONCURRENCY transcriptions run at once and up to
+# TRANSCRIBE_QUEUE_MAX more wait for a slot (429 beyond that, 503 after TRANSCRIBE_QUEUE_TIMEOUT s)
+TRANSCRIBE_MAX_CONCURRENCY = int(os.environ.get("TRANSCRIBE_MAX_CONCURRENCY", "2"))
+TRANSCRIBE_QUEUE_MAX = int(os.environ.get("TRANSCRIBE_QUEUE_MAX", "16"))
+TRANSCRIBE_QUEUE_TIMEOUT = float(os.environ.get("TRANSCRIBE_QUEUE_TIMEOUT", "300"))
+# Requests are admitted before their audio is decoded; until then their length is read
+# with ffprobe or, failing that, estimated from the compressed size at this byte rate
+ADMISSION_BYTES_PER_SECOND = float(os.environ.get("ADMISSION_BYTES_PER_SECOND", "16000"))
+# Waiting transcriptions are ordered by weighted fair queueing over (tenant, priority) flows,
+# costed by audio seconds, so short clips go first and low priority work still drains
+PRIORITY_WEIGHTS = {name.strip(): float(weight) for name, weight in
+                    (item.split("=") for item in os.environ.get("PRIORITY_WEIGHTS", "high=8,normal=4,low=1").split(","))}
+DEFAULT_PRIORITY = os.environ.get("DEFAULT_PRIORITY", "normal")
+# Extra API keys as tenant:key:priority (comma separated); a request may lower its priority, never raise it
+TENANT_API_KEYS = {key: {"tenant": tenant, "priority": priority, "max_priority": priority} for tenant, key, priority in
+                   (item.strip().split(":") for item in os.environ.get("TENANT_API_KEYS", "").split(",") if item.strip())}
+# Tracing: spans are exported over OTLP/HTTP when an endpoint is set (e.g. http://localhost:4318)
+OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "fastwhisper")
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("SUPABASE_URL and SUPABASE_KEY (or SUPABASE_SERVICE_ROLE) must be set")
+for _priority in [DEFAULT_PRIORITY] + [t["priority"] for t in TENANT_API_KEYS.values()]:
+    if _priority not in PRIORITY_WEIGHTS:
+        raise RuntimeError(f"Unknown priority '{_priority}'; PRIORITY_WEIGHTS defines {sorted(PRIORITY_WEIGHTS)}")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Model loading happens off the event loop so the server starts accepting
+    # connections (and answering /health, /ready) right away.
+    threading.Thread(target=warm_up_default_model, name="warmup", daemon=True).start()
+    threading.Thread(target=reap_idle_models, name="model-reaper", daemon=True).start()
+    yield
+    if storage_client is not None:
+        await storage_client.aclose()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()  # flushes spans still queued for export
+    log_listener.stop()  # drains the log queue
+
+app = FastAPI(lifespan=lifespan)
 
 # ========= LOG HELPERS =========
 def now() -> str:
     return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
-def log(msg: str, rid: str = ""):
-    prefix = f"[{now()}]"
-    if rid:
-        prefix += f"[rid:{rid}]"
-    print(prefix, msg, flush=True)
+# Request id of the pipeline being run, for log() calls that don't pass one
+request_id = contextvars.ContextVar("request_id", default="")
+
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        entry.update(record.fields)
+        return json.dumps(entry, default=str)
+
+class TextLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        prefix = f"[{datetime.utcfromtimestamp(record.created).strftime('%Y-%m-%dT%H:%M:%S.%fZ')}]"
+        if record.fields.get("rid"):
+            prefix += f"[rid:{record.fields['rid']}]"
+        extra = {k: v for k, v in record.fields.items() if k not in ("rid", "trace_id")}
+        return f"{prefix} {record.getMessage()}" + (f" {json.dumps(extra, default=str)}" if extra else "")
+
+class LogSampler(logging.Filter):
+    """Keeps every record of a sampled request (by rid hash) and all warnings and errors."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rid = record.fields.get("rid")
+        if LOG_SAMPLE_RATE >= 1 or record.levelno >= logging.WARNING or not rid:
+            return True
+        return zlib.crc32(rid.encode("utf-8")) % 10000 < LOG_SAMPLE_RATE * 10000
+
+logger = logging.getLogger("fastwhisper")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+log_queue = queue.SimpleQueue()
+log_handler = logging.handlers.QueueHandler(log_queue)
+log_handler.addFilter(LogSampler())
+logger.addHandler(log_handler)
+log_stream = logging.StreamHandler(sys.stdout)
+log_stream.setFormatter(TextLogFormatter() if LOG_FORMAT == "text" else JsonLogFormatter())
+log_listener = logging.handlers.QueueListener(log_queue, log_stream)
+log_listener.start()
+
+def log(msg: str, rid: str = "", level: int = logging.INFO, **fields):
+    """
+    Queues a record for the listener thread, which formats and writes it.
+    Extra keyword fields (stage, duration_ms, bytes, ...) become JSON keys.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    fields["rid"] = rid or request_id.get()
+    span_context = trace.get_current_span().get_span_context()
+    if span_context.is_valid:
+        fields["trace_id"] = format(span_context.trace_id, "032x")
+    logger.log(level, msg, extra={"fields": fields})
 
 def log_exc(rid: str = ""):
     tb = traceback.format_exc()
-    log("EXCEPTION:\n" + tb, rid)
+    log("EXCEPTION:\n" + tb, rid, level=logging.ERROR)
 
 def safe_snip(txt: str, n: int = 500) -> str:
     try:
@@ -47,12 +248,248 @@ def safe_snip(txt: str, n: int = 500) -> str:
     except Exception:
         return "<unprintable>"
 
-# ========= INIT WHISPER ONCE =========
-log(f"Loading Whisper model '{WHISPER_MODEL}' ...")
-model = WhisperModel(WHISPER_MODEL, device="cpu", compute_type="int8")
-log("Whisper model loaded.")
+# ========= METRICS =========
+stage_seconds = Histogram("fastwhisper_stage_seconds", "Wall time of each pipeline stage", ["stage"],
+                          buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+stage_errors = Counter("fastwhisper_stage_errors_total", "Pipeline stages that raised, by stage", ["stage"])
+realtime_factor = Histogram("fastwhisper_realtime_factor", "Audio seconds transcribed per wall-clock second",
+                            buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128))
+audio_seconds = Counter("fastwhisper_audio_seconds_total", "Seconds of audio transcribed")
+storage_bytes = Counter("fastwhisper_storage_bytes_total", "Bytes transferred to or from storage", ["direction"])
+pipelines_in_flight = Gauge("fastwhisper_pipelines_in_flight", "Requests and jobs currently inside run_pipeline")
+jobs_queued = Gauge("fastwhisper_jobs_queued", "Async jobs waiting for a worker slot")
+jobs_running = Gauge("fastwhisper_jobs_running", "Async jobs being processed")
+admission_wait_seconds = Histogram("fastwhisper_admission_wait_seconds", "Time spent waiting for a transcription slot",
+                                   ["priority"], buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+admission_rejected = Counter("fastwhisper_admission_rejected_total", "Transcriptions turned away, by reason", ["reason"])
+transcriptions_running = Gauge("fastwhisper_transcriptions_running", "Transcriptions holding an admission slot")
+transcriptions_waiting = Gauge("fastwhisper_transcriptions_waiting", "Transcriptions waiting for an admission slot")
+batch_queue_depth = Gauge("fastwhisper_batch_queue_depth", "Windows waiting for the batched inference worker")
+
+# Per-request breakdown returned with "timings": run_pipeline sets a dict here and the
+# helpers below add to it; tasks and threadpool calls inherit it with their context.
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def add_timing(key: str, amount: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings[key] = timings.get(key, 0) + amount
+
+@contextmanager
+def stage(name: str):
+    """
+    Runs a pipeline stage inside its own span, observes its wall time and
+    counts it as an error if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(name):
+            yield
+    except Exception:
+        stage_errors.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.labels(name).observe(elapsed)
+        add_timing(f"{name}_ms", round(elapsed * 1000, 1))
+        log(f"STAGE {name} took {elapsed * 1000:.1f} ms", level=logging.DEBUG, stage=name,
+            duration_ms=round(elapsed * 1000, 1))
+
+# ========= TRACING =========
+# Without an endpoint the API's no-op tracer is used, so spans cost next to nothing
+tracer_provider = None
+if OTEL_EXPORTER_OTLP_ENDPOINT:
+    tracer_provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(tracer_provider)
+tracer = trace.get_tracer("fastwhisper")
+
+# ========= WHISPER MODELS =========
+if WHISPER_MODEL not in WHISPER_MODELS:
+    WHISPER_MODELS.insert(0, WHISPER_MODEL)
+
+# Rough resident size of int8 CPU models, used to keep the pool inside MODEL_POOL_MAX_MB
+MODEL_MEMORY_MB = {"tiny": 100, "base": 200, "small": 550, "medium": 1600, "large": 3200, "distil": 1700}
+
+cpu_threads = WHISPER_CPU_THREADS or (max(1, (os.cpu_count() or 1) // PARALLEL_CHUNKS) if PARALLEL_CHUNKS > 1 else 0)
+model_pool = OrderedDict()  # name -> entry dict, least recently used first
+model_pool_lock = threading.Lock()
+
+def estimate_model_mb(name: str) -> float:
+    base = os.path.basename(name.rstrip("/")).split(".")[0].split("-")[0]
+    return MODEL_MEMORY_MB.get(base, MODEL_MEMORY_MB["large"])
+
+def evict_models(need_mb: float, keep: str = None):
+    """
+    Drops idle models (nobody using or waiting on them) that exceed
+    MODEL_IDLE_SECONDS, then least recently used ones until need_mb fits the
+    budget. WHISPER_MODEL is never dropped, so /ready stays true. Must be
+    called with model_pool_lock held.
+    """
+    now_ts = time.time()
+    for name, entry in list(model_pool.items()):
+        if name in (keep, WHISPER_MODEL) or entry["in_use"] or entry["model"] is None:
+            continue
+        loaded_mb = sum(e["mb"] for e in model_pool.values() if e["model"] is not None)
+        if now_ts - entry["last_used"] > MODEL_IDLE_SECONDS or loaded_mb + need_mb > MODEL_POOL_MAX_MB:
+            log(f"MODEL EVICT '{name}' (~{entry['mb']:.0f} MB, idle {now_ts - entry['last_used']:.0f}s)")
+            del model_pool[name]
+
+def acquire_model(name: str):
+    """Returns the pool entry for name, loading the model on first use."""
+    with model_pool_lock:
+        entry = model_pool.get(name)
+        if entry is None:
+            entry = {
+                "name": name,
+                "model": None,
+                "mb": estimate_model_mb(name),
+                "in_use": 0,
+                "last_used": time.time(),
+                "slots": threading.Semaphore(MODEL_CONCURRENCY.get(name, MODEL_MAX_CONCURRENCY)),
+                "load_lock": threading.Lock(),
+            }
+            model_pool[name] = entry
+        entry["in_use"] += 1
+        model_pool.move_to_end(name)
+
+    try:
+        with entry["load_lock"]:
+            if entry["model"] is None:
+                with model_pool_lock:
+                    evict_models(entry["mb"], keep=name)
+                log(f"Loading Whisper model '{name}' (workers={PARALLEL_CHUNKS} cpu_threads={cpu_threads or 'auto'}) ...")
+                entry["model"] = WhisperModel(name, device="cpu", compute_type="int8",
+                                              cpu_threads=cpu_threads, num_workers=PARALLEL_CHUNKS)
+                log(f"Whisper model '{name}' loaded.")
+    except Exception:
+        release_model(entry)
+        with model_pool_lock:
+            if entry["model"] is None and model_pool.get(name) is entry:
+                del model_pool[name]
+        raise
+    return entry
+
+def release_model(entry: dict):
+    with model_pool_lock:
+        entry["in_use"] -= 1
+        entry["last_used"] = time.time()
+
+def reap_idle_models():
+    """Drops models idle past MODEL_IDLE_SECONDS even when no other model is being loaded."""
+    while True:
+        time.sleep(max(1.0, MODEL_IDLE_SECONDS / 4))
+        with model_pool_lock:
+            evict_models(0.0)
+
+@contextmanager
+def use_model(name: str, rid: str = "", exclusive: bool = True):
+    """
+    Yields the loaded WhisperModel once one of its slots (MODEL_CONCURRENCY or
+    MODEL_MAX_CONCURRENCY) is free. exclusive=False only pins the model in the pool (batched jobs share
+    the batch scheduler instead of taking a slot).
+    """
+    entry = acquire_model(name)
+    try:
+        if exclusive:
+            with entry["slots"]:
+                yield entry["model"]
+        else:
+            yield entry["model"]
+    finally:
+        release_model(entry)
+
+def resolve_model(data: dict) -> str:
+    name = data.get("model") or WHISPER_MODEL
+    if name not in WHISPER_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{name}'; expected one of {WHISPER_MODELS}")
+    return name
+
+# ========= READINESS =========
+readiness = {
+    "state": "booting",  # booting -> loading -> warming -> ready | failed
+    "model": WHISPER_MODEL,
+    "started_at": None,
+    "ready_at": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "error": None,
+}
+
+def warm_up_default_model():
+    """Loads WHISPER_MODEL and runs one tiny inference so the first real request is warm."""
+    readiness.update(state="loading", started_at=now())
+    t0 = time.time()
+    try:
+        entry = acquire_model(WHISPER_MODEL)
+        try:
+            readiness.update(state="warming", load_seconds=round(time.time() - t0, 3))
+            if WARMUP:
+                t1 = time.time()
+                with entry["slots"]:
+                    segments, _ = entry["model"].transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), beam_size=1)
+                    list(segments)
+                readiness["warmup_seconds"] = round(time.time() - t1, 3)
+                log(f"WARMUP done in {readiness['warmup_seconds']}s")
+        finally:
+            release_model(entry)
+        readiness.update(state="ready", ready_at=now())
+    except Exception as e:
+        log_exc()
+        readiness.update(state="failed", error=f"{type(e).__name__}: {safe_snip(str(e), 200)}")
 
 # ========= SUPABASE HELPERS =========
+# All storage I/O is async on one shared httpx client, so transfers never hold
+# a worker thread and independent uploads can run concurrently.
+RETRY_STATUSES = (500, 502, 503, 504)
+storage_stats = {"requests": 0, "retries": 0, "resumes": 0, "errors": 0}
+storage_stats_lock = threading.Lock()
+storage_client = None
+
+def count_storage(key: str):
+    with storage_stats_lock:
+        storage_stats[key] += 1
+
+def get_storage_client() -> httpx.AsyncClient:
+    """Shared keep-alive client, created on first use inside the running event loop."""
+    global storage_client
+    if storage_client is None:
+        storage_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=STORAGE_POOL_SIZE, max_keepalive_connections=STORAGE_POOL_SIZE),
+            timeout=httpx.Timeout(120.0),
+        )
+    return storage_client
+
+async def storage_request(method: str, url: str, *, stream: bool = False, **kwargs) -> httpx.Response:
+    """
+    Sends a request on the shared client, retrying connection errors and 5xx
+    answers up to STORAGE_RETRIES times with exponential backoff. With
+    stream=True the body is left unread and the caller must aclose() it.
+    """
+    client = get_storage_client()
+    kwargs["headers"] = dict(kwargs.get("headers") or {})
+    inject(kwargs["headers"])  # traceparent, so storage-side traces join ours
+    count_storage("requests")
+    for attempt in range(STORAGE_RETRIES + 1):
+        last_attempt = attempt == STORAGE_RETRIES
+        try:
+            r = await client.send(client.build_request(method, url, **kwargs), stream=stream)
+        except httpx.TransportError:
+            if last_attempt:
+                count_storage("errors")
+                raise
+        else:
+            if r.status_code not in RETRY_STATUSES or last_attempt:
+                return r
+            await r.aclose()
+        count_storage("retries")
+        await asyncio.sleep(STORAGE_BACKOFF * (2 ** attempt))
+
+def storage_pool_stats() -> dict:
+    with storage_stats_lock:
+        return dict(storage_stats, max_connections=STORAGE_POOL_SIZE,
+                    client_open=storage_client is not None and not storage_client.is_closed)
+
 def sb_headers(extra=None):
     h = {
         "Authorization": f"Bearer {SUPABASE_KEY}",
@@ -86,36 +523,281 @@ def normalize_path_in_bucket(raw_path: str, rid: str) -> str:
         log(f"normalize: stripped leading '{RAW_BUCKET}/' -> {p}", rid)
     return p
 
-def sb_download(bucket: str, path_in_bucket: str, dest_path: str, rid: str):
+def sb_object_url(bucket: str, path_in_bucket: str, rid: str):
+    """Returns (url, headers) for reading an object by bucket path or signed URL."""
     if path_in_bucket.startswith("http"):
-        url = path_in_bucket
-        log(f"DOWNLOAD (signed URL) -> {url}", rid)
-        r = requests.get(url, stream=True, timeout=120)
-    else:
-        url = f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path_in_bucket}"
-        log(f"DOWNLOAD (bucket path) -> {url}", rid)
-        r = requests.get(url, headers=sb_headers(), stream=True, timeout=120)
+        log(f"DOWNLOAD (signed URL) -> {path_in_bucket}", rid)
+        return path_in_bucket, {}
+    url = f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path_in_bucket}"
+    log(f"DOWNLOAD (bucket path) -> {url}", rid)
+    return url, sb_headers()
 
-    if r.status_code != 200:
-        body_snip = safe_snip(r.text, 500) if LOG_BODY else f"<{len(r.text)} bytes>"
-        log(f"DOWNLOAD_FAIL status={r.status_code} url={url} body={body_snip}", rid)
-        raise HTTPException(status_code=502, detail=f"Download failed {r.status_code}: {body_snip}")
+async def raise_download_failed(r: httpx.Response, url: str, rid: str):
+    count_storage("errors")
+    await r.aread()
+    await r.aclose()
+    body_snip = safe_snip(r.text, 500) if LOG_BODY else f"<{len(r.text)} bytes>"
+    log(f"DOWNLOAD_FAIL status={r.status_code} url={url} body={body_snip}", rid)
+    raise HTTPException(status_code=502, detail=f"Download failed {r.status_code}: {body_snip}")
+
+def content_length(r: httpx.Response):
+    value = r.headers.get("content-length")
+    return int(value) if value and value.isdigit() else None
+
+def use_ranges(r: httpx.Response, size) -> bool:
+    """Whether an object this size, served by r, is fetched as parallel byte ranges."""
+    return (size is not None and size >= RANGE_MIN_BYTES and DOWNLOAD_PARALLEL > 1
+            and r.headers.get("accept-ranges", "").lower() == "bytes")
+
+async def sb_head(bucket: str, path_in_bucket: str, rid: str):
+    """
+    (identity, size) for the object from a HEAD request. identity is
+    "etag:<etag>:<size>", or None when the store gives no strong ETag and
+    length (the caller then keys the cache on a digest of the downloaded bytes
+    instead); size is None when unknown.
+    """
+    url, headers = sb_object_url(bucket, path_in_bucket, rid)
+    try:
+        r = await storage_request("HEAD", url, headers=headers)
+    except httpx.TransportError as e:
+        log(f"HEAD failed ({type(e).__name__}); identifying the object by its bytes", rid)
+        return None, None
+    etag = r.headers.get("etag", "").strip('"')
+    size = content_length(r) if r.status_code == 200 else None
+    if not etag or etag.startswith("W/") or size is None:
+        log(f"HEAD status={r.status_code} gave no strong ETag; identifying the object by its bytes", rid)
+        return None, size
+    return f"etag:{etag}:{size}", size
+
+async def sb_iter_bytes(url: str, headers: dict, rid: str, start: int = 0, end: int = None,
+                        response: httpx.Response = None, tally: dict = None):
+    """
+    Yields the object's bytes from start through end (inclusive; None = to the
+    end). When the connection drops mid-body the rest is re-requested with a
+    Range header from the last byte received, up to DOWNLOAD_RESUME_ATTEMPTS
+    times. response may be an already opened 200/206 response to continue from.
+    """
+    pos = start
+    attempts = 0
+    while True:
+        if response is None:
+            byte_range = f"bytes={pos}-{'' if end is None else end}"
+            response = await storage_request("GET", url, headers=dict(headers, Range=byte_range), stream=True)
+            if response.status_code != 206:
+                await raise_download_failed(response, url, rid)
+        try:
+            async for chunk in response.aiter_bytes(65536):
+                pos += len(chunk)
+                storage_bytes.labels("download").inc(len(chunk))
+                yield chunk
+            return
+        except httpx.TransportError as e:
+            attempts += 1
+            count_storage("resumes")
+            if tally is not None:
+                tally["resumes"] = tally.get("resumes", 0) + 1
+            if attempts > DOWNLOAD_RESUME_ATTEMPTS:
+                count_storage("errors")
+                log(f"DOWNLOAD gave up at byte {pos} after {attempts - 1} resumes ({type(e).__name__})", rid)
+                raise
+            log(f"DOWNLOAD RESUME from byte {pos} after {type(e).__name__} "
+                f"(attempt {attempts}/{DOWNLOAD_RESUME_ATTEMPTS})", rid)
+            await asyncio.sleep(STORAGE_BACKOFF * (2 ** (attempts - 1)))
+        finally:
+            await response.aclose()
+            response = None
 
+async def download_ranges(url: str, headers: dict, dest_path: str, size: int, rid: str, tally: dict):
+    """Fetches [0, size) into dest_path as parallel byte-range parts."""
     with open(dest_path, "wb") as f:
-        for chunk in r.iter_content(8192):
-            f.write(chunk)
-    log(f"DOWNLOAD OK -> {dest_path}", rid)
+        f.truncate(size)
+    parts = [(start, min(start + RANGE_PART_BYTES, size) - 1) for start in range(0, size, RANGE_PART_BYTES)]
+    log(f"DOWNLOAD ranged: {size} bytes in {len(parts)} parts, {DOWNLOAD_PARALLEL} at a time", rid)
+    part_slots = asyncio.Semaphore(DOWNLOAD_PARALLEL)
 
-def sb_upload(bucket: str, path_in_bucket: str, content_bytes: bytes, content_type: str, rid: str):
-    url = f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path_in_bucket}"
-    headers = sb_headers({"Content-Type": content_type, "x-upsert": "true"})
-    log(f"UPLOAD -> {url}  ({len(content_bytes)} bytes, {content_type})", rid)
-    r = requests.put(url, headers=headers, data=content_bytes, timeout=120)
-    if r.status_code not in (200, 201):
+    async def fetch_part(start: int, end: int):
+        async with part_slots:
+            received = 0
+            with open(dest_path, "r+b") as f:
+                f.seek(start)
+                async for chunk in sb_iter_bytes(url, headers, rid, start, end, tally=tally):
+                    f.write(chunk)
+                    received += len(chunk)
+            if received != end - start + 1:
+                count_storage("errors")
+                raise HTTPException(status_code=502, detail=f"Download part {start}-{end} incomplete: {received} bytes")
+
+    # A failed part cancels its siblings instead of leaving them writing into a doomed file
+    try:
+        async with asyncio.TaskGroup() as parts_group:
+            for start, end in parts:
+                parts_group.create_task(fetch_part(start, end))
+    except ExceptionGroup as failed:
+        raise failed.exceptions[0] from None
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+async def sb_download(bucket: str, path_in_bucket: str, dest_path: str, rid: str) -> str:
+    """
+    Downloads the object to dest_path and returns the sha256 hex digest of its
+    bytes. Large objects are fetched as parallel ranges; either way dropped
+    connections resume where they stopped and the result is checked against
+    Content-Length.
+    """
+    url, headers = sb_object_url(bucket, path_in_bucket, rid)
+    r = await storage_request("GET", url, headers=headers, stream=True)
+    if r.status_code != 200:
+        await raise_download_failed(r, url, rid)
+    size = content_length(r)
+    tally = {"resumes": 0}
+    ranged = use_ranges(r, size)
+
+    if ranged:
+        await r.aclose()
+        await download_ranges(url, headers, dest_path, size, rid, tally)
+        digest = await run_in_threadpool(file_sha256, dest_path)
+    else:
+        sha = hashlib.sha256()
+        with open(dest_path, "wb") as f:
+            async for chunk in sb_iter_bytes(url, headers, rid, response=r, tally=tally):
+                f.write(chunk)
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+    received = os.path.getsize(dest_path)
+    if size is not None and received != size:
+        count_storage("errors")
+        log(f"DOWNLOAD_FAIL size mismatch: got {received} of {size} bytes", rid)
+        raise HTTPException(status_code=502, detail=f"Download incomplete: {received} of {size} bytes")
+    add_timing("download_bytes", received)
+    log(f"DOWNLOAD OK -> {dest_path} ({received} bytes, ranged={ranged}, resumes={tally['resumes']})", rid,
+        bytes=received)
+    return digest
+
+def spool_content(content):
+    """
+    Returns (file object, size) for upload content given as bytes, a seekable
+    binary file, or an iterable of byte chunks. Chunks are written to a spooled
+    temp file, so a generator is never materialized as one bytes object and the
+    upload can seek back when it resumes.
+    """
+    if isinstance(content, (bytes, bytearray)):
+        return io.BytesIO(content), len(content)
+    if hasattr(content, "read"):
+        size = content.seek(0, os.SEEK_END)
+        content.seek(0)
+        return content, size
+    f = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    for chunk in content:
+        f.write(chunk)
+    size = f.tell()
+    f.seek(0)
+    return f, size
+
+def tus_headers(extra: dict) -> dict:
+    return sb_headers(dict({"Tus-Resumable": "1.0.0"}, **extra))
+
+async def sb_upload_resumable(bucket: str, path_in_bucket: str, body, size: int, content_type: str, rid: str):
+    """
+    Uploads through Supabase's TUS endpoint in TUS_CHUNK_BYTES pieces. After a
+    failed piece the server's Upload-Offset is re-read and the upload carries
+    on from there, up to TUS_RESUME_ATTEMPTS times.
+    """
+    create_url = f"{SUPABASE_URL}/storage/v1/upload/resumable"
+    metadata = ",".join(f"{k} {base64.b64encode(v.encode('utf-8')).decode('ascii')}" for k, v in (
+        ("bucketName", bucket), ("objectName", path_in_bucket), ("contentType", content_type)))
+    log(f"UPLOAD (resumable) -> {bucket}/{path_in_bucket}  ({size} bytes, {content_type})", rid)
+    r = await storage_request("POST", create_url, headers=tus_headers(
+        {"Upload-Length": str(size), "Upload-Metadata": metadata, "x-upsert": "true"}))
+    if r.status_code != 201 or "location" not in r.headers:
+        count_storage("errors")
         body_snip = safe_snip(r.text, 500) if LOG_BODY else f"<{len(r.text)} bytes>"
-        log(f"UPLOAD_FAIL status={r.status_code} url={url} body={body_snip}", rid)
+        log(f"UPLOAD_FAIL (tus create) status={r.status_code} body={body_snip}", rid)
         raise HTTPException(status_code=502, detail=f"Upload failed {r.status_code}: {body_snip}")
-    log("UPLOAD OK", rid)
+    upload_url = str(httpx.URL(create_url).join(r.headers["location"]))
+
+    offset = 0
+    attempts = 0
+    while offset < size:
+        body.seek(offset)
+        chunk = body.read(TUS_CHUNK_BYTES)
+        failure = None
+        try:
+            r = await storage_request("PATCH", upload_url, content=chunk, headers=tus_headers(
+                {"Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"}))
+            if r.status_code == 204:
+                offset = int(r.headers.get("upload-offset", offset + len(chunk)))
+                continue
+            failure = f"status={r.status_code}"
+        except httpx.TransportError as e:
+            failure = type(e).__name__
+
+        attempts += 1
+        count_storage("resumes")
+        if attempts > TUS_RESUME_ATTEMPTS:
+            count_storage("errors")
+            log(f"UPLOAD_FAIL (tus) at byte {offset}/{size}: {failure}", rid)
+            raise HTTPException(status_code=502, detail=f"Upload failed at byte {offset} of {size}: {failure}")
+        await asyncio.sleep(STORAGE_BACKOFF * (2 ** (attempts - 1)))
+        head = await storage_request("HEAD", upload_url, headers=tus_headers({}))
+        if head.status_code == 200 and head.headers.get("upload-offset", "").isdigit():
+            offset = int(head.headers["upload-offset"])
+        log(f"UPLOAD RESUME from byte {offset}/{size} after {failure} (attempt {attempts}/{TUS_RESUME_ATTEMPTS})", rid)
+    log(f"UPLOAD OK (resumable, resumes={attempts})", rid, bytes=size)
+
+def record_upload(path_in_bucket: str, size: int, started: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings.setdefault("uploads", {})[path_in_bucket] = {
+            "ms": round((time.perf_counter() - started) * 1000, 1), "bytes": size}
+
+async def sb_upload(bucket: str, path_in_bucket: str, content, content_type: str, rid: str):
+    """
+    content is bytes, a seekable binary file (left open for the caller), or an
+    iterable of byte chunks. Anything of at least TUS_THRESHOLD_BYTES goes
+    through the resumable endpoint, the rest is one PUT.
+    """
+    started = time.perf_counter()
+    owned = not hasattr(content, "read")
+    if isinstance(content, (bytes, bytearray)) or not owned:
+        body, size = spool_content(content)
+    else:
+        body, size = await run_in_threadpool(spool_content, content)
+    try:
+        if size >= TUS_THRESHOLD_BYTES:
+            await sb_upload_resumable(bucket, path_in_bucket, body, size, content_type, rid)
+            storage_bytes.labels("upload").inc(size)
+            record_upload(path_in_bucket, size, started)
+            return
+
+        url = f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path_in_bucket}"
+        headers = sb_headers({"Content-Type": content_type, "x-upsert": "true"})
+        log(f"UPLOAD -> {url}  ({size} bytes, {content_type})", rid)
+        r = await storage_request("PUT", url, headers=headers, content=body.read())
+        if r.status_code not in (200, 201):
+            count_storage("errors")
+            body_snip = safe_snip(r.text, 500) if LOG_BODY else f"<{len(r.text)} bytes>"
+            log(f"UPLOAD_FAIL status={r.status_code} url={url} body={body_snip}", rid)
+            raise HTTPException(status_code=502, detail=f"Upload failed {r.status_code}: {body_snip}")
+        storage_bytes.labels("upload").inc(size)
+        record_upload(path_in_bucket, size, started)
+        log("UPLOAD OK", rid, bytes=size)
+    finally:
+        if owned:
+            body.close()
+
+async def sb_upload_many(uploads: list, rid: str):
+    """Uploads (bucket, path_in_bucket, content, content_type) tuples concurrently."""
+    async def upload_one(bucket: str, path: str, content, content_type: str):
+        with tracer.start_as_current_span("storage.upload", attributes={"storage.bucket": bucket, "storage.path": path}):
+            await sb_upload(bucket, path, content, content_type, rid)
+
+    await asyncio.gather(*(upload_one(*upload) for upload in uploads))
 
 # ========= MEDIA / TRANSCRIPTION =========
 def convert_to_wav(input_path: str, output_path: str, rid: str):
@@ -124,72 +806,1101 @@ def convert_to_wav(input_path: str, output_path: str, rid: str):
     subprocess.run(cmd, check=True)
     log("FFMPEG WAV OK", rid)
 
-def run_transcription(audio_path: str, rid: str):
-    log("WHISPER: transcribe start", rid)
-    segments, info = model.transcribe(audio_path, beam_size=5, word_timestamps=True)
-    log(f"WHISPER: language={info.language} duration={info.duration}", rid)
+async def decode_to_pcm(input_path: str, rid: str) -> np.ndarray:
+    """
+    Decodes input_path to 16 kHz mono float32 samples read from ffmpeg's stdout,
+    ready to be passed to model.transcribe without touching the disk.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-i", input_path, "-f", "f32le", "-acodec", "pcm_f32le",
+           "-ar", str(SAMPLE_RATE), "-ac", "1", "pipe:1"]
+    log(f"FFMPEG to PCM: {' '.join(cmd)}", rid)
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE)
+    pcm, _ = await proc.communicate()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    audio = np.frombuffer(pcm, dtype=np.float32)
+    log(f"FFMPEG PCM OK ({len(audio) / SAMPLE_RATE:.1f}s, {len(pcm)} bytes)", rid)
+    return audio
+
+async def probe_duration(input_path: str, rid: str):
+    """Container duration in seconds from ffprobe, which reads headers only; None when it does not say."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", input_path]
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE,
+                                                    stderr=asyncio.subprocess.DEVNULL)
+        out, _ = await proc.communicate()
+        return float(out)
+    except (OSError, ValueError):
+        log("FFPROBE gave no duration; estimating from the file size", rid)
+        return None
+
+def can_stream(path_in_bucket: str) -> bool:
+    path = path_in_bucket.split("?", 1)[0]
+    return os.path.splitext(path)[1].lower() not in SEEK_REQUIRED_EXTS
+
+async def stream_decode_to_pcm(bucket: str, path_in_bucket: str, rid: str):
+    """
+    Like decode_to_pcm, but pipes the download into ffmpeg's stdin as it arrives
+    so decoding overlaps the network transfer. Only for containers ffmpeg can
+    read without seeking (see can_stream).
+    Returns (audio, sha256 hex digest of the source bytes).
+    """
+    url, headers = sb_object_url(bucket, path_in_bucket, rid)
+    r = await storage_request("GET", url, headers=headers, stream=True)
+    if r.status_code != 200:
+        await raise_download_failed(r, url, rid)
+    size = content_length(r)
+    tally = {"resumes": 0}
+    cmd = ["ffmpeg", "-i", "pipe:0", "-f", "f32le", "-acodec", "pcm_f32le",
+           "-ar", str(SAMPLE_RATE), "-ac", "1", "pipe:1"]
+    log(f"FFMPEG stream to PCM: {' '.join(cmd)}", rid)
+    proc = feeder = None
+    try:
+        proc = await asyncio.create_subprocess_exec(*cmd, stdin=asyncio.subprocess.PIPE,
+                                                    stdout=asyncio.subprocess.PIPE)
+        fed = {"bytes": 0}
+        digest = hashlib.sha256()
+
+        async def feed():
+            try:
+                async for chunk in sb_iter_bytes(url, headers, rid, response=r, tally=tally):
+                    digest.update(chunk)
+                    proc.stdin.write(chunk)
+                    await proc.stdin.drain()
+                    fed["bytes"] += len(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # ffmpeg exited early; its return code tells us why
+            finally:
+                proc.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        pcm = await proc.stdout.read()
+        await proc.wait()
+        await feeder  # re-raises network errors from the download
+    finally:
+        # On errors or cancellation, stop feeding and don't leave ffmpeg running
+        if feeder is not None and not feeder.done():
+            feeder.cancel()
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        await r.aclose()
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    if size is not None and fed["bytes"] != size:
+        count_storage("errors")
+        raise HTTPException(status_code=502, detail=f"Download incomplete: {fed['bytes']} of {size} bytes")
+    audio = np.frombuffer(pcm, dtype=np.float32)
+    add_timing("download_bytes", fed["bytes"])
+    log(f"FFMPEG stream PCM OK ({len(audio) / SAMPLE_RATE:.1f}s from {fed['bytes']} bytes, "
+        f"resumes={tally['resumes']})", rid)
+    return audio, digest.hexdigest()
+
+# Named speed/quality trade-offs passed to model.transcribe.
+# "accurate" is what the service always used before profiles existed.
+DECODE_PROFILES = {
+    "fast": {
+        "beam_size": 1,
+        "best_of": 1,
+        "temperature": [0.0],
+        "word_timestamps": False,
+        "vad_filter": True,
+    },
+    "balanced": {
+        "beam_size": 2,
+        "best_of": 2,
+        "temperature": [0.0, 0.4, 0.8],
+        "word_timestamps": True,
+        "vad_filter": True,
+    },
+    "accurate": {
+        "beam_size": 5,
+        "best_of": 5,
+        "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+        "word_timestamps": True,
+        "vad_filter": False,
+    },
+}
+
+if DECODE_PROFILE not in DECODE_PROFILES:
+    raise RuntimeError(f"DECODE_PROFILE must be one of {sorted(DECODE_PROFILES)}")
+
+def resolve_profile(data: dict) -> str:
+    name = data.get("profile") or DECODE_PROFILE
+    if not isinstance(name, str):
+        raise HTTPException(status_code=400, detail="'profile' must be a string")
+    if name not in DECODE_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{name}'; expected one of {sorted(DECODE_PROFILES)}")
+    return name
+
+def resolve_decode_options(data: dict, profile: str) -> dict:
+    """
+    Profile options plus VAD settings. The request may set "vad" to a bool to
+    force filtering on/off, or to an object with threshold / min_silence_ms /
+    speech_pad_ms overrides (which also turns filtering on).
+    """
+    options = dict(DECODE_PROFILES[profile])
+    vad = data.get("vad")
+    vad_parameters = {
+        "threshold": VAD_THRESHOLD,
+        "min_silence_duration_ms": VAD_MIN_SILENCE_MS,
+        "speech_pad_ms": VAD_SPEECH_PAD_MS,
+    }
+    if isinstance(vad, bool):
+        options["vad_filter"] = vad
+    elif isinstance(vad, dict):
+        options["vad_filter"] = True
+        for key, param, cast, low, high in (("threshold", "threshold", float, 0, 1),
+                                            ("min_silence_ms", "min_silence_duration_ms", int, 0, math.inf),
+                                            ("speech_pad_ms", "speech_pad_ms", int, 0, math.inf)):
+            if key in vad:
+                try:
+                    value = None if isinstance(vad[key], bool) else cast(vad[key])
+                except (TypeError, ValueError, OverflowError):
+                    value = None
+                if value is None or not low <= value <= high:  # also rejects nan
+                    raise HTTPException(status_code=400, detail=f"Invalid vad.{key}: {safe_snip(str(vad[key]), 50)}")
+                vad_parameters[param] = value
+    elif vad is not None:
+        raise HTTPException(status_code=400, detail="vad must be a boolean or an object")
+    if options["vad_filter"]:
+        options["vad_parameters"] = vad_parameters
+    return options
+
+def vad_stats(options: dict, duration: float, speech_duration: float) -> dict:
+    skipped = max(duration - speech_duration, 0.0)
+    return {
+        "enabled": bool(options.get("vad_filter")),
+        "audio_seconds": round(duration, 3),
+        "speech_seconds": round(speech_duration, 3),
+        "skipped_seconds": round(skipped, 3),
+        "skipped_ratio": round(skipped / duration, 4) if duration else 0.0,
+    }
+
+def segment_to_dict(seg, offset: float = 0.0) -> dict:
+    seg_dict = {"id": seg.id, "start": seg.start + offset, "end": seg.end + offset, "text": seg.text}
+    if seg.words:
+        seg_dict["words"] = [{"word": w.word, "start": w.start + offset, "end": w.end + offset} for w in seg.words]
+    return seg_dict
+
+class TranscriptWriter:
+    """
+    Serializes transcript.json and transcript.txt segment by segment into
+    spooled temp files, so memory stays flat however long the transcript gets.
+    The JSON is byte-for-byte what json.dumps() of the whole transcript dict
+    would produce. on_segment, if given, sees every segment as it is added, and
+    so does every extra output builder in outputs ({format: builder}).
+    """
+
+    def __init__(self, on_segment=None, outputs: dict = None):
+        self.on_segment = on_segment
+        self.outputs = outputs or {}
+        self.json_file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self.txt_file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self.segments = 0
+
+    def start(self, duration: float, language: str):
+        head = json.dumps({"duration": duration, "language": language})[:-1]
+        self.json_file.write(f'{head}, "segments": ['.encode("utf-8"))
+        for out in self.outputs.values():
+            out.start(duration, language)
+
+    def add(self, seg_dict: dict):
+        if self.segments:
+            self.json_file.write(b", ")
+            self.txt_file.write(b"\n")
+        self.json_file.write(json.dumps(seg_dict).encode("utf-8"))
+        self.txt_file.write(seg_dict["text"].strip().encode("utf-8"))
+        self.segments += 1
+        trace.get_current_span().add_event("segment", {"id": self.segments, "start": seg_dict["start"],
+                                                       "end": seg_dict["end"]})
+        for out in self.outputs.values():
+            out.add(seg_dict)
+        if self.on_segment:
+            self.on_segment(seg_dict)
+
+    def finish(self):
+        self.json_file.write(b"]}")
+        self.json_file.seek(0)
+        self.txt_file.seek(0)
+
+    def json_size(self) -> int:
+        return self.json_file.seek(0, os.SEEK_END)
+
+    def copy_to(self, dest):
+        for f in (self.json_file, self.txt_file):
+            f.seek(0)
+            shutil.copyfileobj(f, dest)
+
+    def reset(self):
+        for f in (self.json_file, self.txt_file):
+            f.seek(0)
+            f.truncate()
+        self.segments = 0
+
+    def load(self, src, json_bytes: int):
+        """Fills both files from src: json_bytes of JSON followed by the text."""
+        self.reset()
+        remaining = json_bytes
+        while remaining:
+            chunk = src.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise ValueError(f"transcript truncated, {remaining} JSON bytes missing")
+            self.json_file.write(chunk)
+            remaining -= len(chunk)
+        shutil.copyfileobj(src, self.txt_file)
+        self.json_file.seek(0)
+        self.txt_file.seek(0)
+
+    def replay(self):
+        """
+        Feeds the stored segments to on_segment and the outputs (used for cache
+        hits), parsing them one at a time so a long transcript never sits in
+        memory as a single object. Blocking: run it off the event loop.
+        """
+        if not self.on_segment and not self.outputs:
+            return
+        self.json_file.seek(0)
+        decoder = json.JSONDecoder()
+        text = codecs.getincrementaldecoder("utf-8")()
+        buf = ""
+
+        def read_more() -> bool:
+            nonlocal buf
+            chunk = self.json_file.read(64 * 1024)
+            buf += text.decode(chunk, final=not chunk)
+            return bool(chunk)
+
+        # start() wrote '{"duration": ..., "language": ..., "segments": [' as the head
+        while '"segments": [' not in buf:
+            if not read_more():
+                raise ValueError("transcript has no segments array")
+        head, buf = buf.split('"segments": [', 1)
+        header = json.loads(head.rstrip().rstrip(",") + "}")
+        for out in self.outputs.values():
+            out.start(header["duration"], header["language"])
+        while True:
+            buf = buf.lstrip(", ")
+            if buf.startswith("]"):
+                break
+            try:
+                seg_dict, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if not read_more():
+                    raise ValueError("transcript truncated inside segments")
+                continue
+            buf = buf[end:]
+            for out in self.outputs.values():
+                out.add(seg_dict)
+            if self.on_segment:
+                self.on_segment(seg_dict)
+        self.json_file.seek(0)
+
+    def close(self):
+        self.json_file.close()
+        self.txt_file.close()
+        for out in self.outputs.values():
+            out.close()
+
+class CompactTranscript:
+    """
+    Columnar transcript for consumers that would rather not parse word-level
+    JSON: little-endian float32 start/end arrays for segments and words, and
+    uint32 indices into one deduplicated string table, packed as MessagePack.
+    Segment i (id i + 1) owns words[word_offsets[i]:word_offsets[i + 1]].
+    """
+
+    def __init__(self):
+        self.duration = 0.0
+        self.language = None
+        self.strings = []
+        self.string_ids = {}
+        self.seg_start, self.seg_end, self.seg_text = array("f"), array("f"), array("I")
+        self.word_offsets = array("I", [0])
+        self.word_start, self.word_end, self.word_text = array("f"), array("f"), array("I")
+
+    def intern(self, text: str) -> int:
+        idx = self.string_ids.get(text)
+        if idx is None:
+            idx = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return idx
+
+    def start(self, duration: float, language: str):
+        self.duration = duration
+        self.language = language
+
+    def add(self, seg_dict: dict):
+        self.seg_start.append(seg_dict["start"])
+        self.seg_end.append(seg_dict["end"])
+        self.seg_text.append(self.intern(seg_dict["text"]))
+        for w in seg_dict.get("words", ()):
+            self.word_start.append(w["start"])
+            self.word_end.append(w["end"])
+            self.word_text.append(self.intern(w["word"]))
+        self.word_offsets.append(len(self.word_text))
+
+    def encode(self) -> bytes:
+        f32 = lambda a: np.asarray(a, dtype="<f4").tobytes()
+        u32 = lambda a: np.asarray(a, dtype="<u4").tobytes()
+        return msgpack.packb({
+            "version": 1,
+            "duration": self.duration,
+            "language": self.language,
+            "strings": self.strings,
+            "segments": {"start": f32(self.seg_start), "end": f32(self.seg_end), "text": u32(self.seg_text),
+                         "word_offsets": u32(self.word_offsets)},
+            "words": {"start": f32(self.word_start), "end": f32(self.word_end), "text": u32(self.word_text)},
+        }, use_bin_type=True)
+
+    def close(self):
+        pass
+
+class SubtitleWriter:
+    """
+    Writes SRT or WebVTT cues to a spooled temp file as segments arrive. Each
+    segment is split into cues of at most max_lines lines of max_line_chars
+    and at most max_cue_seconds, breaking on word timings when the segment has
+    them and spreading its time over the characters of its words otherwise.
+    """
+
+    def __init__(self, kind: str, settings: dict):
+        self.kind = kind
+        self.max_line_chars = settings["max_line_chars"]
+        self.max_lines = settings["max_lines"]
+        self.max_cue_seconds = settings["max_cue_seconds"]
+        self.file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self.cues = 0
+        if kind == "vtt":
+            self.file.write(b"WEBVTT\n\n")
+
+    def start(self, duration: float, language: str):
+        pass
+
+    def add(self, seg_dict: dict):
+        for start, end, lines in self.split(self.timed_words(seg_dict)):
+            self.write_cue(start, end, lines)
+
+    @staticmethod
+    def timed_words(seg_dict: dict) -> list:
+        if seg_dict.get("words"):
+            return seg_dict["words"]
+        pieces = [" " + piece for piece in seg_dict["text"].split()]
+        total = sum(len(piece) for piece in pieces)
+        span = seg_dict["end"] - seg_dict["start"]
+        words, pos = [], 0
+        for piece in pieces:
+            start = seg_dict["start"] + span * pos / total
+            pos += len(piece)
+            words.append({"word": piece, "start": start, "end": seg_dict["start"] + span * pos / total})
+        return words
+
+    def split(self, words: list):
+        """Yields (start, end, lines) cues, wrapping greedily at max_line_chars."""
+        cue, lines = [], []
+        for w in words:
+            if cue:
+                joined = lines[-1] + w["word"]
+                wrapped = lines[:-1] + [joined] if len(joined.strip()) <= self.max_line_chars else lines + [w["word"]]
+                if len(wrapped) <= self.max_lines and w["end"] - cue[0]["start"] <= self.max_cue_seconds:
+                    cue.append(w)
+                    lines = wrapped
+                    continue
+                yield cue[0]["start"], cue[-1]["end"], lines
+            cue, lines = [w], [w["word"]]
+        if cue:
+            yield cue[0]["start"], cue[-1]["end"], lines
+
+    def timestamp(self, seconds: float) -> str:
+        ms = int(round(max(seconds, 0.0) * 1000))
+        h, ms = divmod(ms, 3600000)
+        m, ms = divmod(ms, 60000)
+        sec, ms = divmod(ms, 1000)
+        sep = "," if self.kind == "srt" else "."
+        return f"{h:02d}:{m:02d}:{sec:02d}{sep}{ms:03d}"
+
+    def write_cue(self, start: float, end: float, lines: list):
+        self.cues += 1
+        head = f"{self.cues}\n" if self.kind == "srt" else ""
+        text = "\n".join(line.strip() for line in lines)
+        cue = f"{head}{self.timestamp(start)} --> {self.timestamp(end)}\n{text}\n\n"
+        self.file.write(cue.encode("utf-8"))
+
+    def encode(self):
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+# Extra artifacts a request can ask for with "formats"; each is uploaded as transcript.<ext>.
+# build() gets the resolved subtitle settings and returns the builder fed by TranscriptWriter.
+OUTPUT_FORMATS = {
+    "msgpack": {"build": lambda settings: CompactTranscript(), "ext": "msgpack", "content_type": "application/msgpack"},
+    "srt": {"build": lambda settings: SubtitleWriter("srt", settings), "ext": "srt",
+            "content_type": "application/x-subrip; charset=utf-8"},
+    "vtt": {"build": lambda settings: SubtitleWriter("vtt", settings), "ext": "vtt",
+            "content_type": "text/vtt; charset=utf-8"},
+}
+
+def resolve_formats(data: dict) -> list:
+    formats = data.get("formats", TRANSCRIPT_FORMATS)
+    if isinstance(formats, str):
+        formats = [f.strip() for f in formats.split(",") if f.strip()]
+    if not isinstance(formats, list) or not all(isinstance(f, str) for f in formats):
+        raise HTTPException(status_code=400, detail="'formats' must be a list of strings or a comma-separated string")
+    for name in formats:
+        if name not in OUTPUT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown format '{name}'; expected one of {sorted(OUTPUT_FORMATS)}")
+    return list(dict.fromkeys(formats))
+
+def resolve_subtitle_settings(data: dict) -> dict:
+    """Cue limits, optionally overridden by a "subtitles" object with the same keys."""
+    settings = {
+        "max_line_chars": SUBTITLE_MAX_LINE_CHARS,
+        "max_lines": SUBTITLE_MAX_LINES,
+        "max_cue_seconds": SUBTITLE_MAX_CUE_SECONDS,
+    }
+    overrides = data.get("subtitles", {})
+    if not isinstance(overrides, dict):
+        raise HTTPException(status_code=400, detail="subtitles must be an object")
+    for key, cast in (("max_line_chars", int), ("max_lines", int), ("max_cue_seconds", float)):
+        if key in overrides:
+            try:
+                settings[key] = 0 if isinstance(overrides[key], bool) else cast(overrides[key])
+            except (TypeError, ValueError, OverflowError):
+                settings[key] = 0
+            if not 0 < settings[key] < math.inf:  # also rejects nan
+                raise HTTPException(status_code=400, detail=f"Invalid subtitles.{key}: {safe_snip(str(overrides[key]), 50)}")
+    return settings
+
+def split_on_silence(audio: np.ndarray) -> list:
+    """
+    Returns (start, end) sample ranges of roughly CHUNK_TARGET_SECONDS, cutting
+    in the middle of VAD-detected silences so no chunk boundary splits speech.
+    """
+    target = int(CHUNK_TARGET_SECONDS * SAMPLE_RATE)
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500))
+    bounds = []
+    chunk_start = 0
+    for prev, nxt in zip(speech, speech[1:]):
+        cut = (prev["end"] + nxt["start"]) // 2
+        if cut - chunk_start >= target:
+            bounds.append((chunk_start, cut))
+            chunk_start = cut
+    bounds.append((chunk_start, len(audio)))
+    return bounds
+
+def run_transcription_chunked(model, audio: np.ndarray, bounds: list, options: dict, rid: str,
+                              writer: TranscriptWriter, progress=None):
+    """
+    Transcribes each chunk on its own model worker and stitches the segments
+    back into writer with global timestamps and renumbered ids.
+    """
+    duration = len(audio) / SAMPLE_RATE
+    # Detect the language once on the opening audio so every chunk agrees
+    _, info = model.transcribe(audio[: 30 * SAMPLE_RATE], **options)
+    language = info.language
+    log(f"WHISPER: chunked language={language} duration={duration:.1f} chunks={len(bounds)} workers={PARALLEL_CHUNKS}", rid)
+
+    done = {"seconds": 0.0, "speech_seconds": 0.0}
+    done_lock = threading.Lock()
+
+    def transcribe_chunk(start: int, end: int) -> list:
+        offset = start / SAMPLE_RATE
+        segments, chunk_info = model.transcribe(audio[start:end], language=language, **options)
+        seg_dicts = [segment_to_dict(seg, offset) for seg in segments]
+        with done_lock:
+            done["seconds"] += (end - start) / SAMPLE_RATE
+            done["speech_seconds"] += chunk_info.duration_after_vad
+            if progress:
+                progress("transcribe", min(done["seconds"] / duration, 1.0))
+        return seg_dicts
+
+    writer.start(duration, language)
+    with ThreadPoolExecutor(max_workers=PARALLEL_CHUNKS, thread_name_prefix=f"chunk-{rid}") as pool:
+        # map() yields in chunk order, so segments are stitched (and streamed) in order
+        for seg_dicts in pool.map(lambda b: transcribe_chunk(*b), bounds):
+            for seg_dict in seg_dicts:
+                seg_dict["id"] = writer.segments + 1
+                writer.add(seg_dict)
+    log("WHISPER: chunked transcribe done", rid)
+    return {"duration": duration, "language": language,
+            "vad": vad_stats(options, duration, done["speech_seconds"])}
+
+# ========= BATCHED INFERENCE =========
+# faster-whisper 1.0.x has no batched pipeline, so windows are fed to the
+# underlying ctranslate2 model directly: one generate() call per batch, with
+# the prompt (language) chosen per window. Windows are decoded without
+# timestamps, so each becomes one segment and word timestamps are not
+# available; profiles that want words keep using model.transcribe.
+batch_queue = queue.Queue()
+batch_queue_depth.set_function(batch_queue.qsize)
+
+def batch_worker():
+    while True:
+        items = [batch_queue.get()]
+        deadline = time.time() + BATCH_MAX_WAIT_MS / 1000.0
+        while len(items) < BATCH_SIZE:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(batch_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
 
-    transcript_json = {"duration": info.duration, "language": info.language, "segments": []}
-    txt_lines = []
+        groups = {}
+        for item in items:
+            groups.setdefault((id(item["model"]), item["beam_size"]), []).append(item)
+        for group in groups.values():
+            run_batch(group)
 
+def run_batch(items: list):
+    model = items[0]["model"]
+    try:
+        features = ctranslate2.StorageView.from_array(np.ascontiguousarray(np.stack([it["features"] for it in items])))
+        results = model.model.generate(
+            features,
+            [it["prompt"] for it in items],
+            beam_size=items[0]["beam_size"],
+            max_length=model.max_length,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+        )
+        for item, result in zip(items, results):
+            item["future"].set_result(result.sequences_ids[0])
+    except Exception as e:
+        for item in items:
+            if not item["future"].done():
+                item["future"].set_exception(e)
+
+if BATCH_INFERENCE:
+    threading.Thread(target=batch_worker, name="batcher", daemon=True).start()
+
+def speech_windows(audio: np.ndarray, options: dict) -> list:
+    """
+    Merges VAD speech regions into (start, end) sample windows of at most 30 s,
+    or, with VAD off, cuts the whole audio into consecutive 30 s windows.
+    """
+    max_len = 30 * SAMPLE_RATE
+    if not options.get("vad_filter"):
+        return [(start, min(start + max_len, len(audio))) for start in range(0, len(audio), max_len)]
+    vad_parameters = options.get("vad_parameters") or {}
+    windows = []
+    for region in get_speech_timestamps(audio, VadOptions(max_speech_duration_s=30, **vad_parameters)):
+        if windows and region["end"] - windows[-1][0] <= max_len:
+            windows[-1] = (windows[-1][0], region["end"])
+        else:
+            windows.append((region["start"], region["end"]))
+    return windows
+
+def run_transcription_batched(model, audio: np.ndarray, options: dict, rid: str, writer: TranscriptWriter,
+                              progress=None):
+    duration = len(audio) / SAMPLE_RATE
+    windows = speech_windows(audio, options)
+    n_frames = model.feature_extractor.nb_max_frames
+
+    def window_features(start: int, end: int) -> np.ndarray:
+        return model.feature_extractor(audio[start:end])[:, :n_frames]
+
+    first_features = window_features(*windows[0]) if windows else None
+    language = "en"
+    if model.model.is_multilingual and windows:
+        lang_probs = model.model.detect_language(ctranslate2.StorageView.from_array(np.ascontiguousarray(first_features[None])))
+        language = lang_probs[0][0][0][2:-2]  # "<|en|>" -> "en"
+    log(f"WHISPER: batched language={language} duration={duration:.1f} windows={len(windows)}", rid)
+
+    tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+    prompt = list(tokenizer.sot_sequence) + [tokenizer.no_timestamps]
+
+    def submit(index: int) -> Future:
+        feats = first_features if index == 0 else window_features(*windows[index])
+        future = Future()
+        batch_queue.put({"model": model, "beam_size": options["beam_size"], "features": feats,
+                         "prompt": prompt, "future": future})
+        return future
+
+    # Features are computed as windows are submitted, and at most BATCH_SIZE of
+    # this job's windows are queued at once, so a long file neither holds all its
+    # features in memory nor pushes other jobs' windows to the back of the queue
+    in_flight = deque()
+    submitted = 0
+    writer.start(duration, language)
+    for i, (start, end) in enumerate(windows):
+        while submitted < len(windows) and len(in_flight) < BATCH_SIZE:
+            in_flight.append(submit(submitted))
+            submitted += 1
+        text = tokenizer.decode(in_flight.popleft().result())
+        writer.add({"id": i + 1, "start": start / SAMPLE_RATE, "end": end / SAMPLE_RATE, "text": text})
+        if progress:
+            progress("transcribe", (i + 1) / len(windows))
+
+    speech_seconds = sum(end - start for start, end in windows) / SAMPLE_RATE
+    log("WHISPER: batched transcribe done", rid)
+    return {"duration": duration, "language": language,
+            "vad": vad_stats(options, duration, speech_seconds)}
+
+def run_transcription(audio, writer: TranscriptWriter, rid: str, progress=None, options: dict = None,
+                      model_name: str = WHISPER_MODEL) -> dict:
+    """
+    audio is either a file path or a float32 PCM array at SAMPLE_RATE.
+    Segments are written to writer as soon as they are decoded.
+    Returns {"duration", "language", "vad"}.
+    """
+    options = options or DECODE_PROFILES[DECODE_PROFILE]
+    if BATCH_INFERENCE and not options["word_timestamps"] and isinstance(audio, np.ndarray):
+        with use_model(model_name, rid, exclusive=False) as model:
+            meta = run_transcription_batched(model, audio, options, rid, writer, progress)
+    else:
+        with use_model(model_name, rid) as model:
+            meta = transcribe_with(model, audio, rid, writer, progress, options)
+    writer.finish()
+    return meta
+
+def transcribe_with(model, audio, rid: str, writer: TranscriptWriter, progress, options: dict) -> dict:
+    if PARALLEL_CHUNKS > 1 and isinstance(audio, np.ndarray) and len(audio) >= PARALLEL_MIN_SECONDS * SAMPLE_RATE:
+        bounds = split_on_silence(audio)
+        if len(bounds) > 1:
+            return run_transcription_chunked(model, audio, bounds, options, rid, writer, progress)
+
+    log(f"WHISPER: transcribe start beam_size={options['beam_size']} vad={options['vad_filter']}", rid)
+    segments, info = model.transcribe(audio, **options)
+    log(f"WHISPER: language={info.language} duration={info.duration} after_vad={info.duration_after_vad}", rid)
+
+    writer.start(info.duration, info.language)
     for seg in segments:
-        seg_dict = {"id": seg.id, "start": seg.start, "end": seg.end, "text": seg.text}
-        if seg.words:
-            seg_dict["words"] = [{"word": w.word, "start": w.start, "end": w.end} for w in seg.words]
-        transcript_json["segments"].append(seg_dict)
-        txt_lines.append(seg.text.strip())
+        writer.add(segment_to_dict(seg))
+        if progress and info.duration:
+            progress("transcribe", min(seg.end / info.duration, 1.0))
 
-    transcript_txt = "\n".join(txt_lines)
     log("WHISPER: transcribe done", rid)
-    return transcript_json, transcript_txt
+    return {"duration": info.duration, "language": info.language,
+            "vad": vad_stats(options, info.duration, info.duration_after_vad)}
 
-# ========= ROUTES =========
-@app.get("/health")
-def health():
-    return {"status": "ok"}
+# ========= TRANSCRIPT CACHE =========
+cache_lock = threading.Lock()
 
-@app.post("/process")
-def process(data: dict, x_api_key: str = Header(None)):
-    rid = str(uuid.uuid4())[:8]
-    temp_dir = None
+def transcript_cache_key(source_digest: str, options: dict, model_name: str) -> str:
+    params = {
+        "source": source_digest,
+        "model": model_name,
+        "sample_rate": SAMPLE_RATE,
+        "options": options,
+        "batched": BATCH_INFERENCE,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+def cache_local_path(key: str) -> str:
+    return os.path.join(TRANSCRIPT_CACHE_DIR, f"{key}.entry")
+
+def cache_bucket_path(key: str) -> str:
+    return f"_cache/{key}.entry"
+
+def cache_tmp_path(key: str) -> str:
+    os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+    return cache_local_path(key) + f".{uuid.uuid4().hex}.tmp"
+
+# An entry is one line of JSON metadata ({"duration", "language", "vad",
+# "json_bytes"}) followed by the raw transcript.json and transcript.txt bytes,
+# so both artifacts are copied through without being parsed.
+def cache_store_local(key: str, tmp_path: str):
+    """Atomically publishes a written entry, then evicts least recently used entries over the size bound."""
+    os.replace(tmp_path, cache_local_path(key))
+
+    max_bytes = TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024
+    with cache_lock:
+        entries = []
+        for name in os.listdir(TRANSCRIPT_CACHE_DIR):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                st = os.stat(os.path.join(TRANSCRIPT_CACHE_DIR, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(os.path.join(TRANSCRIPT_CACHE_DIR, name))
+                total -= size
+            except FileNotFoundError:
+                pass
+
+def cache_write_local(key: str, writer: TranscriptWriter, meta: dict):
+    tmp_path = cache_tmp_path(key)
     try:
-        log(f"REQ: /process body={safe_snip(json.dumps(data))}", rid)
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(dict(meta, json_bytes=writer.json_size())).encode("utf-8") + b"\n")
+            writer.copy_to(f)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    cache_store_local(key, tmp_path)
+
+def cache_read_local(key: str, writer: TranscriptWriter):
+    path = cache_local_path(key)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        meta = json.loads(f.readline())
+        writer.load(f, meta.pop("json_bytes"))
+    os.utime(path)  # bump recency for LRU eviction
+    return meta
+
+async def cache_get(key: str, writer: TranscriptWriter, rid: str):
+    """Loads a cached transcript into writer and returns {"duration", "language", "vad"}, or None."""
+    if TRANSCRIPT_CACHE_MAX_MB <= 0:
+        return None
+    found = os.path.exists(cache_local_path(key))
+    if found:
+        log(f"CACHE HIT (local) key={key[:16]}", rid)
+    elif TRANSCRIPT_CACHE_BUCKET:
+        tmp_path = cache_tmp_path(key)
+        try:
+            await sb_download(TRANSCRIPTS_BUCKET, cache_bucket_path(key), tmp_path, rid)
+            await run_in_threadpool(cache_store_local, key, tmp_path)
+            found = True
+            log(f"CACHE HIT (bucket) key={key[:16]}", rid)
+        except HTTPException:
+            pass
+        except Exception:
+            log_exc(rid)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    if not found:
+        log(f"CACHE MISS key={key[:16]}", rid)
+        return None
+    try:
+        meta = await run_in_threadpool(cache_read_local, key, writer)
+        if meta is not None:
+            return meta
+    except Exception:
+        log(f"CACHE entry unreadable, ignoring key={key[:16]}", rid)
+    writer.reset()
+    return None
+
+async def cache_put(key: str, writer: TranscriptWriter, meta: dict, rid: str):
+    """Best effort: cache failures are logged and never fail the request."""
+    if TRANSCRIPT_CACHE_MAX_MB <= 0:
+        return
+    try:
+        await run_in_threadpool(cache_write_local, key, writer, meta)
+    except Exception:
+        log_exc(rid)
+        return
+    if TRANSCRIPT_CACHE_BUCKET:
+        try:
+            with open(cache_local_path(key), "rb") as f:
+                await sb_upload(TRANSCRIPTS_BUCKET, cache_bucket_path(key), f, "application/octet-stream", rid)
+        except Exception:
+            log_exc(rid)
+
+# ========= ADMISSION =========
+# Only touched from the event loop, so no lock. Waiters are admitted by weighted fair
+# queueing: on arrival each waiter is stamped with a virtual start (the later of its
+# (tenant, priority) flow's last finish and the virtual clock) and a finish of
+# start + audio_seconds / weight, and the smallest finish goes next. Tags are fixed
+# once stamped, so each flow gets its weight's share of audio seconds and a long low
+# priority job drains behind any stream of short ones. Within a flow the pending
+# waiters are re-chained shortest audio first from the flow's earliest pending start.
+# Requests between arrival and admit() (downloading, probing) hold a reservation that
+# counts against TRANSCRIBE_QUEUE_MAX, so the bound covers work already accepted.
+admission = {"running": 0, "waiting": [], "reserved": 0, "avg_seconds": None, "vtime": 0.0, "flows": {}, "seq": 0}
+transcriptions_running.set_function(lambda: admission["running"])
+transcriptions_waiting.set_function(lambda: len(admission["waiting"]))
+
+def resolve_priority(data: dict, tenant: dict) -> str:
+    name = data.get("priority") or tenant["priority"]
+    if not isinstance(name, str):
+        raise HTTPException(status_code=400, detail="'priority' must be a string")
+    if name not in PRIORITY_WEIGHTS:
+        raise HTTPException(status_code=400, detail=f"Unknown priority '{name}'; expected one of {sorted(PRIORITY_WEIGHTS)}")
+    if PRIORITY_WEIGHTS[name] > PRIORITY_WEIGHTS[tenant["max_priority"]]:
+        raise HTTPException(status_code=403, detail=f"Priority '{name}' is above this API key's '{tenant['max_priority']}'")
+    return name
+
+def retry_after() -> str:
+    """Seconds until the queue has likely moved enough for a retry, from the average slot hold time."""
+    avg = admission["avg_seconds"] or 30.0
+    queued = len(admission["waiting"]) + admission["reserved"]
+    return str(max(1, math.ceil(avg * (queued + 1) / TRANSCRIBE_MAX_CONCURRENCY)))
+
+def reject_admission(status_code: int, reason: str, rid: str):
+    admission_rejected.labels(reason).inc()
+    log(f"ADMISSION rejected ({reason}): running={admission['running']} waiting={len(admission['waiting'])} "
+        f"reserved={admission['reserved']}", rid, level=logging.WARNING)
+    raise HTTPException(status_code=status_code, detail=f"transcription_{reason}", headers={"Retry-After": retry_after()})
+
+def check_admission(rid: str):
+    """
+    Fails fast with 429 before any download when the wait queue is already
+    full. Free slots count as room too, since reserved requests will take them.
+    """
+    free_slots = max(0, TRANSCRIBE_MAX_CONCURRENCY - admission["running"])
+    if len(admission["waiting"]) + admission["reserved"] >= TRANSCRIBE_QUEUE_MAX + free_slots:
+        reject_admission(429, "queue_full", rid)
+
+def reserve_admission(rid: str, interactive: bool = True) -> dict:
+    """Takes a place in the wait queue (429 for interactive callers when full) before any download starts."""
+    if interactive:
+        check_admission(rid)
+    admission["reserved"] += 1
+    admission["seq"] += 1
+    return {"held": True, "seq": admission["seq"]}
+
+def cancel_reservation(reservation: dict):
+    if reservation and reservation["held"]:
+        reservation["held"] = False
+        admission["reserved"] -= 1
+
+def stamp_waiter(waiter: dict):
+    """Adds waiter to its flow and (re)stamps the flow's pending waiters, shortest first."""
+    pending = [w for w in admission["waiting"] if w["flow"] == waiter["flow"] and not w["slot"].done()]
+    if pending:
+        start = min(w["start"] for w in pending)
+    else:
+        start = max(admission["flows"].get(waiter["flow"], 0.0), admission["vtime"])
+    for w in sorted(pending + [waiter], key=lambda w: (w["seconds"], w["seq"])):
+        w["start"] = start
+        w["finish"] = start = start + w["seconds"] / PRIORITY_WEIGHTS[w["priority"]]
+    admission["flows"][waiter["flow"]] = start
+    admission["waiting"].append(waiter)
+
+def dispatch_admissions():
+    """Fills free slots with the waiters of smallest virtual finish time (ties: arrival order)."""
+    # Waiters that timed out or were cancelled may still be listed; never hand them a slot
+    admission["waiting"] = [w for w in admission["waiting"] if not w["slot"].done()]
+    while admission["running"] < TRANSCRIBE_MAX_CONCURRENCY and admission["waiting"]:
+        waiter = min(admission["waiting"], key=lambda w: (w["finish"], w["seq"]))
+        admission["waiting"].remove(waiter)
+        waiter["slot"].set_result(None)
+        admission["running"] += 1
+        admission["vtime"] = max(admission["vtime"], waiter["start"])
+    # Idle flows that fell behind the virtual clock would restart from it anyway
+    busy = {w["flow"] for w in admission["waiting"]}
+    admission["flows"] = {f: v for f, v in admission["flows"].items() if v > admission["vtime"] or f in busy}
+
+async def admit(rid: str, seconds: float, tenant: str = "default", priority: str = DEFAULT_PRIORITY,
+                interactive: bool = True, reservation: dict = None):
+    """
+    Waits for a transcription slot for seconds of audio. Interactive callers
+    are bounded by TRANSCRIBE_QUEUE_MAX and TRANSCRIBE_QUEUE_TIMEOUT; background
+    jobs (already bounded by JOB_QUEUE_MAX) just wait their turn. A held
+    reservation turns into the waiter, keeping its arrival order.
+    """
+    start = time.perf_counter()
+    if reservation and reservation["held"]:
+        cancel_reservation(reservation)
+        seq = reservation["seq"]
+    else:
+        if interactive:
+            check_admission(rid)
+        admission["seq"] += 1
+        seq = admission["seq"]
+    waiter = {"slot": asyncio.get_running_loop().create_future(), "flow": (tenant, priority),
+              "priority": priority, "seconds": seconds, "seq": seq}
+    stamp_waiter(waiter)
+    dispatch_admissions()
+    slot = waiter["slot"]
+    if not slot.done():
+        log(f"ADMISSION waiting: tenant={tenant} priority={priority} audio={seconds:.1f}s "
+            f"running={admission['running']} waiting={len(admission['waiting'])}", rid)
+        try:
+            await asyncio.wait_for(slot, TRANSCRIBE_QUEUE_TIMEOUT if interactive else None)
+        except asyncio.TimeoutError:
+            if waiter in admission["waiting"]:
+                admission["waiting"].remove(waiter)
+            reject_admission(503, "queue_timeout", rid)
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                release_admission(0.0)  # admitted just as we were cancelled
+            elif waiter in admission["waiting"]:
+                admission["waiting"].remove(waiter)
+            raise
+    waited = time.perf_counter() - start
+    admission_wait_seconds.labels(priority).observe(waited)
+    add_timing("queue_wait_ms", round(waited * 1000, 1))
+
+def release_admission(held_seconds: float):
+    if held_seconds > 0:
+        avg = admission["avg_seconds"]
+        admission["avg_seconds"] = held_seconds if avg is None else 0.8 * avg + 0.2 * held_seconds
+    admission["running"] -= 1
+    dispatch_admissions()
 
-        if x_api_key != API_KEY:
-            log("AUTH FAIL (X-API-KEY mismatch)", rid)
-            raise HTTPException(status_code=401, detail="Unauthorized")
+@asynccontextmanager
+async def transcription_slot(rid: str, seconds: float, tenant: str = "default", priority: str = DEFAULT_PRIORITY,
+                             interactive: bool = True, reservation: dict = None):
+    await admit(rid, seconds, tenant, priority, interactive, reservation)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        release_admission(time.perf_counter() - start)
 
-        raw_path_in = data.get("rawPath")
-        processed_prefix = data.get("processedPrefix")  # still used to place transcripts nicely
-        if not raw_path_in or not processed_prefix:
-            log("BAD REQUEST: missing rawPath or processedPrefix", rid)
-            raise HTTPException(status_code=400, detail="Missing rawPath or processedPrefix")
+# ========= PIPELINE =========
+def no_progress(stage: str, fraction=None):
+    pass
 
+async def run_pipeline(data: dict, rid: str, progress=no_progress, on_segment=None, trace_context=None,
+                       interactive: bool = True):
+    """
+    Runs run_stages under a "pipeline" span, continuing the caller's trace
+    when trace_context (extracted from the request headers) carries one.
+    """
+    attributes = {"request.id": rid, "media.path": str(data.get("rawPath"))}
+    rid_token = request_id.set(rid)
+    try:
+        with tracer.start_as_current_span("pipeline", context=trace_context, attributes=attributes) as span:
+            resp = await run_stages(data, rid, progress, on_segment, interactive)
+            span.set_attributes({"audio.duration": resp["duration"], "whisper.model": resp["model"],
+                                 "cache.hit": resp["cache_hit"]})
+            return resp
+    finally:
+        request_id.reset(rid_token)
+
+async def run_stages(data: dict, rid: str, progress=no_progress, on_segment=None, interactive: bool = True):
+    """
+    Runs download -> WAV -> transcription -> upload for an already validated
+    /process body and returns the response payload. Storage and ffmpeg I/O are
+    awaited on the event loop; only transcription occupies a worker thread.
+    The request holds a queue reservation from the start and is admitted (see
+    ADMISSION) before its audio is decoded.
+    on_segment receives each transcript segment as it becomes available.
+    With "timings" set, the payload also carries a per-stage breakdown.
+    Any failure is surfaced as an HTTPException.
+    """
+    raw_path_in = data.get("rawPath")
+    processed_prefix = data.get("processedPrefix")  # still used to place transcripts nicely
+    profile = resolve_profile(data)
+    options = resolve_decode_options(data, profile)
+    model_name = resolve_model(data)
+    temp_dir = None
+    formats = resolve_formats(data)
+    subtitle_settings = resolve_subtitle_settings(data)
+    writer = TranscriptWriter(on_segment, {name: OUTPUT_FORMATS[name]["build"](subtitle_settings) for name in formats})
+    pipelines_in_flight.inc()
+    started = time.perf_counter()
+    timings = {}
+    timings_token = request_timings.set(timings)
+    reservation = None
+    slot = AsyncExitStack()  # the transcription slot, once admitted
+    try:
         # Normalize the input path (we won't upload the video again)
         path_in_bucket = normalize_path_in_bucket(raw_path_in, rid)
         log(f"NORMALIZED rawPath -> {path_in_bucket}", rid)
 
         # Work dir
         temp_dir = tempfile.mkdtemp()
-        log(f"TEMP DIR -> {temp_dir}", rid)
+        log(f"TEMP DIR -> {temp_dir}", rid, level=logging.DEBUG)
 
-        # 1) Download the existing WEBM (to transcribe)
-        local_raw = os.path.join(temp_dir, os.path.basename(path_in_bucket) or "input.webm")
-        sb_download(RAW_BUCKET, path_in_bucket, local_raw, rid)
+        # Hold a place in the transcription queue from here on, so the queue bound
+        # also covers requests that are still downloading
+        reservation = reserve_admission(rid, interactive)
+        tenant, priority = data.get("_tenant", "default"), data.get("_priority", DEFAULT_PRIORITY)
 
-        # 2) Convert to WAV
-        local_wav = os.path.join(temp_dir, "audio.wav")
-        convert_to_wav(local_raw, local_wav, rid)
+        # Identical media with identical settings -> reuse the earlier transcript. The
+        # object's ETag and size identify it before any byte is fetched; without them
+        # the key is the sha256 of the download, looked up before ffmpeg runs.
+        identity, size = await sb_head(RAW_BUCKET, path_in_bucket, rid)
+        cache_key = meta = cached = None
+        if identity and TRANSCRIPT_CACHE_MAX_MB > 0:
+            cache_key = transcript_cache_key(identity, options, model_name)
+            meta = cached = await cache_get(cache_key, writer, rid)
 
-        # 3) Transcribe
-        transcript_json, transcript_txt = run_transcription(local_wav, rid)
+        audio = None
+        local_raw = None
+        digest_lookup = TRANSCRIPT_CACHE_MAX_MB > 0 and not identity
+        # Only objects under RANGE_MIN_BYTES are streamed: streaming holds a transcription slot
+        # for the whole transfer, and large objects download faster as parallel ranges anyway
+        if (not cached and AUDIO_PIPE and STREAM_DOWNLOAD and can_stream(path_in_bucket) and not digest_lookup
+                and size is not None and size < RANGE_MIN_BYTES):
+            # Streaming decodes as it downloads, so admit first, costed from the object size
+            progress("waiting")
+            await slot.enter_async_context(transcription_slot(
+                rid, size / ADMISSION_BYTES_PER_SECOND, tenant, priority, interactive, reservation))
+            # 1+2) Stream the download through ffmpeg into PCM
+            progress("download")
+            try:
+                with stage("stream_decode"):
+                    audio, source_digest = await stream_decode_to_pcm(RAW_BUCKET, path_in_bucket, rid)
+            except (subprocess.CalledProcessError, httpx.TransportError) as e:
+                log(f"STREAM DECODE FAILED ({type(e).__name__}); falling back to download-then-convert", rid)
+
+        if not cached and audio is None:
+            # 1) Download the existing WEBM (to transcribe)
+            progress("download")
+            local_raw = os.path.join(temp_dir, os.path.basename(path_in_bucket) or "input.webm")
+            with stage("download"):
+                source_digest = await sb_download(RAW_BUCKET, path_in_bucket, local_raw, rid)
+
+        if cache_key is None:
+            cache_key = transcript_cache_key(source_digest, options, model_name)
+            meta = cached = await cache_get(cache_key, writer, rid)
+        if cached:
+            cancel_reservation(reservation)
+            await run_in_threadpool(writer.replay)
+        else:
+            if audio is None:
+                if reservation["held"]:
+                    # Admit before decoding, so queued requests hold compressed files rather than PCM
+                    seconds = await probe_duration(local_raw, rid)
+                    if seconds is None:
+                        seconds = os.path.getsize(local_raw) / ADMISSION_BYTES_PER_SECOND
+                    progress("waiting")
+                    await slot.enter_async_context(transcription_slot(
+                        rid, seconds, tenant, priority, interactive, reservation))
+                # 2) Decode to PCM in memory (or convert to WAV when AUDIO_PIPE is off)
+                progress("convert")
+                with stage("convert"):
+                    if AUDIO_PIPE:
+                        audio = await decode_to_pcm(local_raw, rid)
+                    else:
+                        audio = os.path.join(temp_dir, "audio.wav")
+                        await run_in_threadpool(convert_to_wav, local_raw, audio, rid)
+
+            # 3) Transcribe in the slot taken above, then free it for the next request
+            progress("transcribe", 0.0)
+            t0 = time.perf_counter()
+            with stage("transcribe"):
+                meta = await run_in_threadpool(run_transcription, audio, writer, rid, progress, options, model_name)
+            elapsed = time.perf_counter() - t0
+            await slot.aclose()
+            audio_seconds.inc(meta["duration"])
+            if elapsed > 0:
+                realtime_factor.observe(meta["duration"] / elapsed)
+                timings["rtf"] = round(meta["duration"] / elapsed, 2)
+            await cache_put(cache_key, writer, meta, rid)
 
         # 4) Upload ONLY transcripts (NO video upload here)
+        progress("upload")
         transcript_base = f"{processed_prefix}/transcript"
         transcript_json_path = f"{transcript_base}.json"
         transcript_txt_path = f"{transcript_base}.txt"
-        sb_upload(TRANSCRIPTS_BUCKET, transcript_json_path, json.dumps(transcript_json).encode("utf-8"), "application/json", rid)
-        sb_upload(TRANSCRIPTS_BUCKET, transcript_txt_path, transcript_txt.encode("utf-8"), "text/plain; charset=utf-8", rid)
+        uploads = [
+            (TRANSCRIPTS_BUCKET, transcript_json_path, writer.json_file, "application/json"),
+            (TRANSCRIPTS_BUCKET, transcript_txt_path, writer.txt_file, "text/plain; charset=utf-8"),
+        ]
+        outputs = {}
+        for name, out in writer.outputs.items():
+            fmt = OUTPUT_FORMATS[name]
+            t0 = time.perf_counter()
+            body, size = spool_content(await run_in_threadpool(out.encode))
+            encode_ms = round((time.perf_counter() - t0) * 1000, 1)
+            path = f"{transcript_base}.{fmt['ext']}"
+            outputs[name] = {"path": path, "bytes": size, "encode_ms": encode_ms}
+            log(f"ENCODED {name}: {size} bytes in {encode_ms} ms (json {writer.json_size()} bytes)", rid)
+            uploads.append((TRANSCRIPTS_BUCKET, path, body, fmt["content_type"]))
+        with stage("upload"):
+            await sb_upload_many(uploads, rid)
 
         # 5) Respond with paths expected by your n8n/Supabase schema
         resp = {
@@ -198,10 +1909,19 @@ def process(data: dict, x_api_key: str = Header(None)):
             "processed_path": f"{RAW_BUCKET}/{path_in_bucket}",
             "transcript_json": transcript_json_path,
             "transcript_txt": transcript_txt_path,
-            "duration": transcript_json["duration"],
-            "language": transcript_json["language"],
+            "duration": meta["duration"],
+            "language": meta["language"],
+            "model": model_name,
+            "profile": profile,
+            "vad": meta["vad"],
+            "formats": outputs,
+            "cache_hit": bool(cached),
             "request_id": rid,
         }
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        log("TIMINGS", rid, timings=timings)
+        if data.get("timings"):
+            resp["timings"] = timings
         log("RESP: " + safe_snip(json.dumps(resp)), rid)
         return resp
 
@@ -216,9 +1936,440 @@ def process(data: dict, x_api_key: str = Header(None)):
         log_exc(rid)
         raise HTTPException(status_code=500, detail="internal_error")
     finally:
+        await slot.aclose()
+        cancel_reservation(reservation)
+        request_timings.reset(timings_token)
+        pipelines_in_flight.dec()
+        writer.close()
         try:
             if temp_dir:
                 shutil.rmtree(temp_dir, ignore_errors=True)
-                log("CLEANUP temp dir", rid)
+                log("CLEANUP temp dir", rid, level=logging.DEBUG)
         except Exception:
             log("CLEANUP error (ignored)", rid)
+
+# ========= JOBS =========
+# Jobs run as event-loop tasks; JOB_WORKERS of them may be inside run_pipeline at once
+jobs = {}
+jobs_lock = threading.Lock()
+job_slots = asyncio.Semaphore(JOB_WORKERS)
+job_tasks = set()  # strong refs so running tasks aren't garbage collected
+
+def count_jobs(state: str) -> int:
+    with jobs_lock:
+        return sum(1 for j in jobs.values() if j["state"] == state)
+
+jobs_queued.set_function(lambda: count_jobs("queued"))
+jobs_running.set_function(lambda: count_jobs("running"))
+
+def job_view(job: dict) -> dict:
+    return {k: v for k, v in job.items() if not k.startswith("_")}
+
+def job_update(job_id: str, **fields):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+            job["updated_at"] = now()
+
+def prune_jobs():
+    """Drops finished jobs older than JOB_TTL_SECONDS."""
+    cutoff = time.time() - JOB_TTL_SECONDS
+    with jobs_lock:
+        expired = [jid for jid, j in jobs.items() if j.get("_finished_ts") and j["_finished_ts"] < cutoff]
+        for jid in expired:
+            del jobs[jid]
+
+async def run_job(job_id: str, data: dict, rid: str, trace_context=None):
+    async with job_slots:
+        await run_job_now(job_id, data, rid, trace_context)
+
+async def run_job_now(job_id: str, data: dict, rid: str, trace_context=None):
+    job_update(job_id, state="running", started_at=now())
+    log(f"JOB {job_id} start", rid)
+
+    def progress(stage: str, fraction=None):
+        job_update(job_id, stage=stage, progress=fraction)
+
+    try:
+        result = await run_pipeline(data, rid, progress, trace_context=trace_context, interactive=False)
+        job_update(job_id, state="done", stage="done", progress=1.0, result=result,
+                   finished_at=now(), _finished_ts=time.time())
+        log(f"JOB {job_id} done", rid)
+    except HTTPException as he:
+        job_update(job_id, state="failed", error={"status_code": he.status_code, "detail": he.detail},
+                   finished_at=now(), _finished_ts=time.time())
+        log(f"JOB {job_id} failed status={he.status_code}", rid)
+    except Exception:
+        # run_pipeline maps its own errors; this only guards the bookkeeping above
+        log_exc(rid)
+        job_update(job_id, state="failed", error={"status_code": 500, "detail": "internal_error"},
+                   finished_at=now(), _finished_ts=time.time())
+
+def submit_job(data: dict, rid: str, trace_context=None) -> dict:
+    prune_jobs()
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        queued = sum(1 for j in jobs.values() if j["state"] == "queued")
+        if queued >= JOB_QUEUE_MAX:
+            log(f"JOB QUEUE FULL ({queued} queued)", rid)
+            raise HTTPException(status_code=503, detail="job_queue_full")
+        jobs[job_id] = {
+            "job_id": job_id,
+            "request_id": rid,
+            "state": "queued",
+            "stage": "queued",
+            "progress": None,
+            "created_at": now(),
+            "updated_at": now(),
+            "result": None,
+            "error": None,
+        }
+    task = asyncio.create_task(run_job(job_id, data, rid, trace_context))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+    log(f"JOB {job_id} queued", rid)
+    return {"job_id": job_id, "state": "queued", "status_url": f"/jobs/{job_id}", "request_id": rid}
+
+# ========= ROUTES =========
+def tenant_for_key(key: str):
+    """The {"tenant", "priority", "max_priority"} entry for an accepted API key, or None."""
+    if key == API_KEY:
+        return {"tenant": "default", "priority": DEFAULT_PRIORITY,
+                "max_priority": max(PRIORITY_WEIGHTS, key=PRIORITY_WEIGHTS.get)}
+    return TENANT_API_KEYS.get(key)
+
+def check_api_key(x_api_key: str, rid: str) -> dict:
+    tenant = tenant_for_key(x_api_key)
+    if tenant is None:
+        log("AUTH FAIL (X-API-KEY mismatch)", rid)
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return tenant
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    with model_pool_lock:
+        loaded = [name for name, entry in model_pool.items() if entry["model"] is not None]
+    body = dict(readiness, loaded_models=loaded)
+    return JSONResponse(status_code=200 if readiness["state"] == "ready" else 503, content=body)
+
+def validate_process_request(data: dict, x_api_key: str, rid: str):
+    """
+    Rejects bad requests up front and records the caller's scheduling flow in
+    data["_tenant"] / data["_priority"] (overwriting anything the client sent).
+    """
+    tenant = check_api_key(x_api_key, rid)
+
+    if not data.get("rawPath") or not data.get("processedPrefix"):
+        log("BAD REQUEST: missing rawPath or processedPrefix", rid)
+        raise HTTPException(status_code=400, detail="Missing rawPath or processedPrefix")
+    resolve_decode_options(data, resolve_profile(data))
+    resolve_model(data)
+    resolve_formats(data)
+    resolve_subtitle_settings(data)
+    data["_tenant"] = tenant["tenant"]
+    data["_priority"] = resolve_priority(data, tenant)
+
+@app.post("/process")
+async def process(data: dict, request: Request, x_api_key: str = Header(None)):
+    rid = str(uuid.uuid4())[:8]
+    trace_context = extract(request.headers)
+    try:
+        log(f"REQ: /process body={safe_snip(json.dumps(data))}", rid)
+        validate_process_request(data, x_api_key, rid)
+
+        if data.get("async", PROCESS_ASYNC_DEFAULT):
+            return JSONResponse(status_code=202, content=submit_job(data, rid, trace_context))
+        check_admission(rid)
+    except HTTPException as he:
+        log(f"HTTPException {he.status_code}: {safe_snip(str(he.detail))}", rid)
+        raise
+
+    return await run_pipeline(data, rid, trace_context=trace_context)
+
+def sse_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.post("/process/stream")
+async def process_stream(data: dict, request: Request, x_api_key: str = Header(None)):
+    """
+    Same work as /process, answered as Server-Sent Events: "progress" on each
+    stage change, one "segment" per decoded segment, then "done" with the
+    usual /process payload (or "error" with status_code/detail).
+    """
+    rid = str(uuid.uuid4())[:8]
+    trace_context = extract(request.headers)
+    try:
+        log(f"REQ: /process/stream body={safe_snip(json.dumps(data))}", rid)
+        validate_process_request(data, x_api_key, rid)
+        check_admission(rid)
+    except HTTPException as he:
+        log(f"HTTPException {he.status_code}: {safe_snip(str(he.detail))}", rid)
+        raise
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    last_stage = {"stage": None}
+
+    def emit(item):
+        # Segment and progress callbacks fire on the transcription thread
+        loop.call_soon_threadsafe(events.put_nowait, item)
+
+    def progress(stage: str, fraction=None):
+        if stage != last_stage["stage"]:
+            last_stage["stage"] = stage
+            emit(("progress", {"stage": stage}))
+
+    async def work():
+        try:
+            emit(("done", await run_pipeline(data, rid, progress, on_segment=lambda seg: emit(("segment", seg)),
+                                             trace_context=trace_context)))
+        except HTTPException as he:
+            emit(("error", {"status_code": he.status_code, "detail": he.detail, "request_id": rid}))
+        except Exception:
+            log_exc(rid)
+            emit(("error", {"status_code": 500, "detail": "internal_error", "request_id": rid}))
+        finally:
+            emit(None)
+
+    # The pipeline keeps going (and uploads) even if the client disconnects mid-stream
+    task = asyncio.create_task(work())
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+
+    async def event_stream():
+        yield sse_event("start", {"request_id": rid})
+        while True:
+            item = await events.get()
+            if item is None:
+                break
+            yield sse_event(*item)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats")
+def stats(x_api_key: str = Header(None)):
+    check_api_key(x_api_key, "")
+    return {"storage": storage_pool_stats()}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus exposition; carries no request data, so it is open like /health."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, x_api_key: str = Header(None)):
+    check_api_key(x_api_key, "")
+    prune_jobs()
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job_not_found")
+        return job_view(job)
+
+# ========= LIVE TRANSCRIPTION =========
+LIVE_FORMATS = ("s16le", "f32le", "webm", "ogg")
+
+def transcribe_live_buffer(model_name: str, audio: np.ndarray, options: dict, language):
+    with use_model(model_name) as model:
+        segments, info = model.transcribe(audio, language=language, **options)
+        return [segment_to_dict(seg) for seg in segments], info.language
+
+def shift_segment(seg_dict: dict, offset: float) -> dict:
+    shifted = dict(seg_dict, start=seg_dict["start"] + offset, end=seg_dict["end"] + offset)
+    if "words" in seg_dict:
+        shifted["words"] = [dict(w, start=w["start"] + offset, end=w["end"] + offset) for w in seg_dict["words"]]
+    return shifted
+
+async def receive_live_auth(ws: WebSocket):
+    """Tenant for the {"type": "auth", "api_key": ...} message a client must send first without an X-API-KEY header."""
+    try:
+        msg = await asyncio.wait_for(ws.receive_json(), LIVE_AUTH_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, ValueError, KeyError, WebSocketDisconnect):
+        return None
+    if not isinstance(msg, dict) or msg.get("type") != "auth" or not isinstance(msg.get("api_key"), str):
+        return None
+    return tenant_for_key(msg["api_key"])
+
+@app.websocket("/live")
+async def live(ws: WebSocket, x_api_key: str = Header(None),
+               audio_format: str = Query("s16le", alias="format"), model: str = Query(None),
+               profile: str = Query(None), language: str = Query(None)):
+    """
+    Real-time transcription. Clients without an X-API-KEY header first send
+    {"type": "auth", "api_key": "..."} (keys never go in the URL, which ends up
+    in access logs). The client then sends binary frames of 16 kHz mono
+    PCM (format=s16le|f32le) or a MediaRecorder Opus stream (format=webm|ogg,
+    decoded through ffmpeg), and a text frame {"type": "end"} when done.
+    The server answers {"type": "partial", "segments": [...]} for the still
+    changing tail and {"type": "final", "segment": {...}} once a segment is
+    settled, using the /process segment shape with stream-global timestamps,
+    then {"type": "done"}.
+    """
+    rid = str(uuid.uuid4())[:8]
+    await ws.accept()
+    tenant = tenant_for_key(x_api_key) if x_api_key is not None else await receive_live_auth(ws)
+    if tenant is None:
+        log("LIVE AUTH FAIL", rid)
+        await ws.close(code=1008)
+        return
+    try:
+        check_admission(rid)
+    except HTTPException:
+        await ws.close(code=1013)  # try again later
+        return
+    try:
+        params = {"model": model, "profile": profile}
+        model_name = resolve_model(params)
+        options = resolve_decode_options(params, resolve_profile(params))
+        if audio_format not in LIVE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {list(LIVE_FORMATS)}")
+    except HTTPException as he:
+        await ws.send_json({"type": "error", "detail": he.detail})
+        await ws.close(code=1003)
+        return
+
+    log(f"LIVE start format={audio_format} model={model_name}", rid)
+    await ws.send_json({"type": "ready", "request_id": rid})
+
+    state = {
+        "buffer": np.zeros(0, dtype=np.float32),
+        "buffer_start": 0.0,  # stream time of buffer[0], seconds
+        "new_samples": 0,
+        "next_id": 1,
+        "language": language,
+        "ended": False,
+        "remainder": b"",
+    }
+    audio_ready = asyncio.Event()
+
+    def append_pcm(samples: np.ndarray):
+        state["buffer"] = np.concatenate([state["buffer"], samples])
+        state["new_samples"] += len(samples)
+        if state["new_samples"] >= LIVE_STEP_SECONDS * SAMPLE_RATE:
+            audio_ready.set()
+
+    def append_raw(data: bytes, sample_bytes: int):
+        data = state["remainder"] + data
+        usable = len(data) - len(data) % sample_bytes
+        state["remainder"] = data[usable:]
+        if sample_bytes == 2:
+            append_pcm(np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0)
+        else:
+            append_pcm(np.frombuffer(data[:usable], dtype=np.float32))
+
+    ffmpeg = None
+    if audio_format in ("webm", "ogg"):
+        ffmpeg = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-loglevel", "error", "-f", audio_format, "-i", "pipe:0",
+            "-f", "f32le", "-acodec", "pcm_f32le", "-ar", str(SAMPLE_RATE), "-ac", "1", "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+
+    async def pump_ffmpeg():
+        while True:
+            data = await ffmpeg.stdout.read(65536)
+            if not data:
+                break
+            append_raw(data, 4)
+
+    async def receive():
+        pump = asyncio.create_task(pump_ffmpeg()) if ffmpeg else None
+        try:
+            while True:
+                msg = await ws.receive()
+                if msg["type"] == "websocket.disconnect":
+                    break
+                if msg.get("bytes"):
+                    if ffmpeg:
+                        ffmpeg.stdin.write(msg["bytes"])
+                        await ffmpeg.stdin.drain()
+                    else:
+                        append_raw(msg["bytes"], 2 if audio_format == "s16le" else 4)
+                elif msg.get("text"):
+                    try:
+                        if json.loads(msg["text"]).get("type") == "end":
+                            break
+                    except (ValueError, AttributeError):
+                        pass
+        finally:
+            if ffmpeg:
+                ffmpeg.stdin.close()
+                await pump
+                await ffmpeg.wait()
+            state["ended"] = True
+            audio_ready.set()
+
+    async def transcribe_loop():
+        while True:
+            await audio_ready.wait()
+            audio_ready.clear()
+            final_pass = state["ended"]
+            snapshot = state["buffer"]
+            state["new_samples"] = 0
+            if len(snapshot) == 0:
+                if final_pass:
+                    return
+                continue
+
+            # Each pass competes for a slot like any other transcription (never rejected mid-stream)
+            async with transcription_slot(rid, len(snapshot) / SAMPLE_RATE, tenant["tenant"], tenant["priority"],
+                                          interactive=False):
+                segs, detected = await run_in_threadpool(transcribe_live_buffer, model_name, snapshot, options,
+                                                         state["language"])
+            buffer_seconds = len(snapshot) / SAMPLE_RATE
+            if final_pass:
+                commit = segs
+            else:
+                commit = [seg for seg in segs if seg["end"] <= buffer_seconds - LIVE_COMMIT_MARGIN_SECONDS]
+                if not commit and buffer_seconds > LIVE_MAX_BUFFER_SECONDS:
+                    # No natural break yet; settle everything but the tail to bound the buffer
+                    commit = segs[:-1] if len(segs) > 1 else segs
+            if commit and state["language"] is None:
+                state["language"] = detected
+
+            offset = state["buffer_start"]
+            for seg in commit:
+                final_seg = shift_segment(seg, offset)
+                final_seg["id"] = state["next_id"]
+                state["next_id"] += 1
+                await ws.send_json({"type": "final", "segment": final_seg})
+            cut = None
+            if commit:
+                cut = buffer_seconds if final_pass else commit[-1]["end"]
+            elif not final_pass and buffer_seconds > LIVE_MAX_BUFFER_SECONDS:
+                # Nothing recognised (silence, noise): keep only the tail a next word could start in
+                cut = buffer_seconds - LIVE_COMMIT_MARGIN_SECONDS
+            if cut is not None:
+                cut_samples = min(int(cut * SAMPLE_RATE), len(snapshot))
+                state["buffer"] = state["buffer"][cut_samples:]
+                state["buffer_start"] += cut_samples / SAMPLE_RATE
+            partial = [shift_segment(seg, offset) for seg in segs[len(commit):]]
+            if partial:
+                await ws.send_json({"type": "partial", "segments": partial})
+            if final_pass:
+                return
+
+    receiver = asyncio.create_task(receive())
+    try:
+        await transcribe_loop()
+        await ws.send_json({"type": "done", "segments": state["next_id"] - 1, "language": state["language"],
+                            "audio_seconds": round(state["buffer_start"] + len(state["buffer"]) / SAMPLE_RATE, 3)})
+        await ws.close()
+        log(f"LIVE done segments={state['next_id'] - 1}", rid)
+    except WebSocketDisconnect:
+        log("LIVE client disconnected", rid)
+    except Exception:
+        log_exc(rid)
+        try:
+            await ws.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        receiver.cancel()
+        if ffmpeg and ffmpeg.returncode is None:
+            ffmpeg.kill()
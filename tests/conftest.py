@@ -0,0 +1,7 @@
+import os
+import sys
+
+# main.py refuses to import without storage credentials; the tests never reach storage
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def fresh_admission(monkeypatch):
+    monkeypatch.setattr(main, "TRANSCRIBE_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(main, "TRANSCRIBE_QUEUE_MAX", 16)
+    monkeypatch.setattr(main, "TRANSCRIBE_QUEUE_TIMEOUT", 300.0)
+    main.admission.update(running=0, waiting=[], reserved=0, avg_seconds=None, vtime=0.0, flows={}, seq=0)
+    yield
+
+
+def admit(rid, seconds, tenant, priority, interactive=False):
+    return asyncio.create_task(main.admit(rid, seconds, tenant, priority, interactive))
+
+
+def test_low_priority_job_drains_behind_constant_high_priority_stream():
+    async def scenario():
+        await main.admit("holder", 1.0, "a", "normal", False)
+        bulk = admit("bulk", 3600.0, "b", "low")
+        clip = admit("clip", 60.0, "c", "high")
+        await asyncio.sleep(0)
+        clips = 0
+        while not bulk.done() and clips < 3000:
+            main.release_admission(1.0)
+            await asyncio.sleep(0)
+            if clip.done():
+                clips += 1
+                clip = admit("clip", 60.0, "c", "high")
+                await asyncio.sleep(0)
+        clip.cancel()
+        return bulk.done(), clips
+
+    admitted, clips = asyncio.run(scenario())
+    assert admitted
+    # 3600 s at weight 1 vs 60 s clips at weight 8 -> its turn comes after ~480 clips
+    assert 470 <= clips <= 490
+
+
+def test_shortest_audio_first_within_a_flow():
+    async def scenario():
+        await main.admit("holder", 1.0, "a", "normal", False)
+        long_job = admit("long", 600.0, "t", "normal")
+        await asyncio.sleep(0)
+        short_job = admit("short", 10.0, "t", "normal")
+        await asyncio.sleep(0)
+        main.release_admission(1.0)
+        await asyncio.sleep(0)
+        first = (short_job.done(), long_job.done())
+        main.release_admission(1.0)
+        await asyncio.sleep(0)
+        return first, long_job.done()
+
+    assert asyncio.run(scenario()) == ((True, False), True)
+
+
+def test_cancelled_waiter_is_skipped_on_release():
+    async def scenario():
+        await main.admit("holder", 1.0, "a", "normal", False)
+        gone = admit("gone", 5.0, "b", "normal")
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        main.release_admission(1.0)  # must not hand the slot to the cancelled waiter
+        assert main.admission["running"] == 0
+        await asyncio.wait_for(main.admit("next", 5.0, "c", "normal", False), 1)
+        return main.admission["running"]
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_timed_out_waiter_gets_503_and_frees_nothing(monkeypatch):
+    monkeypatch.setattr(main, "TRANSCRIBE_QUEUE_TIMEOUT", 0.05)
+
+    async def scenario():
+        await main.admit("holder", 1.0, "a", "normal", False)
+        with pytest.raises(HTTPException) as exc:
+            await main.admit("late", 5.0, "b", "normal", True)
+        main.release_admission(1.0)
+        await asyncio.wait_for(main.admit("next", 5.0, "c", "normal", True), 1)
+        return exc.value, main.admission["running"], main.admission["waiting"]
+
+    error, running, waiting = asyncio.run(scenario())
+    assert error.status_code == 503 and "Retry-After" in error.headers
+    assert running == 1 and waiting == []
+
+
+def test_full_queue_rejects_interactive_with_429(monkeypatch):
+    monkeypatch.setattr(main, "TRANSCRIBE_QUEUE_MAX", 1)
+
+    async def scenario():
+        await main.admit("holder", 1.0, "a", "normal", False)
+        queued = admit("queued", 5.0, "b", "normal", True)
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc:
+            await main.admit("rejected", 5.0, "c", "normal", True)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        return exc.value
+
+    assert asyncio.run(scenario()).status_code == 429
+
+
+def test_reservations_count_against_the_queue_bound(monkeypatch):
+    monkeypatch.setattr(main, "TRANSCRIBE_QUEUE_MAX", 2)
+
+    async def scenario():
+        await main.admit("holder", 1.0, "a", "normal", False)
+        downloading = [main.reserve_admission(f"r{i}") for i in range(2)]
+        with pytest.raises(HTTPException) as exc:
+            main.reserve_admission("rejected")
+        background = main.reserve_admission("job", interactive=False)
+        main.cancel_reservation(background)
+        # A reservation turns into a waiter without being counted twice
+        queued = asyncio.create_task(main.admit("r0", 5.0, "b", "normal", True, downloading[0]))
+        await asyncio.sleep(0)
+        counts = main.admission["reserved"], len(main.admission["waiting"])
+        main.cancel_reservation(downloading[1])
+        main.release_admission(1.0)
+        await asyncio.wait_for(queued, 1)
+        return exc.value.status_code, counts, main.admission["reserved"]
+
+    assert asyncio.run(scenario()) == (429, (1, 1), 0)
+
+
+def test_burst_with_free_slots_is_bounded(monkeypatch):
+    monkeypatch.setattr(main, "TRANSCRIBE_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "TRANSCRIBE_QUEUE_MAX", 4)
+    accepted = 0
+    with pytest.raises(HTTPException) as exc:
+        for i in range(500):
+            main.reserve_admission(f"r{i}")
+            accepted += 1
+    # Two requests for the free slots plus four queued
+    assert (accepted, exc.value.status_code) == (6, 429)
@@ -0,0 +1,14 @@
+import numpy as np
+
+import main
+
+
+def test_windows_without_vad_cover_the_whole_audio_in_30s_steps():
+    audio = np.zeros(75 * main.SAMPLE_RATE, dtype=np.float32)
+    windows = main.speech_windows(audio, dict(main.DECODE_PROFILES["fast"], vad_filter=False))
+    step = 30 * main.SAMPLE_RATE
+    assert windows == [(0, step), (step, 2 * step), (2 * step, len(audio))]
+
+
+def test_no_windows_for_empty_audio_without_vad():
+    assert main.speech_windows(np.zeros(0, dtype=np.float32), {"vad_filter": False}) == []
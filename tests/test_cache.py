@@ -0,0 +1,69 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import main
+
+META = {"duration": 2.0, "language": "en", "vad": {"enabled": False}}
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "TRANSCRIPT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "TRANSCRIPT_CACHE_MAX_MB", 1)
+    monkeypatch.setattr(main, "TRANSCRIPT_CACHE_BUCKET", False)
+    return tmp_path
+
+
+def transcript(text=" hello"):
+    writer = main.TranscriptWriter()
+    writer.start(META["duration"], META["language"])
+    writer.add({"id": 1, "start": 0.0, "end": 2.0, "text": text})
+    writer.finish()
+    return writer
+
+
+def test_key_depends_on_source_model_and_options():
+    options = main.DECODE_PROFILES["fast"]
+    key = main.transcript_cache_key("etag:abc:10", options, "base")
+    assert key == main.transcript_cache_key("etag:abc:10", dict(options), "base")
+    assert key != main.transcript_cache_key("etag:abd:10", options, "base")
+    assert key != main.transcript_cache_key("etag:abc:10", options, "small")
+    assert key != main.transcript_cache_key("etag:abc:10", dict(options, beam_size=3), "base")
+
+
+def test_entry_round_trip_copies_both_artifacts():
+    source = transcript()
+    main.cache_write_local("k1", source, META)
+    loaded = main.TranscriptWriter()
+    assert main.cache_read_local("k1", loaded) == META
+    assert json.loads(loaded.json_file.read())["segments"][0]["text"] == " hello"
+    assert loaded.txt_file.read() == b"hello"
+    assert main.cache_read_local("missing", main.TranscriptWriter()) is None
+
+
+def test_store_evicts_least_recently_used_entries_over_the_bound(cache_dir, monkeypatch):
+    for i, key in enumerate(("old", "used")):
+        main.cache_write_local(key, transcript(), META)
+        os.utime(main.cache_local_path(key), (1000 + i, 1000 + i))
+    main.cache_read_local("old", main.TranscriptWriter())  # a hit makes "old" the most recently used
+    entry_bytes = os.path.getsize(main.cache_local_path("old"))
+    monkeypatch.setattr(main, "TRANSCRIPT_CACHE_MAX_MB", 2.5 * entry_bytes / (1024 * 1024))
+    main.cache_write_local("new", transcript(), META)
+    assert sorted(os.listdir(cache_dir)) == ["new.entry", "old.entry"]
+
+
+def test_get_ignores_an_unreadable_entry(cache_dir):
+    (cache_dir / "bad.entry").write_bytes(b"not json\n")
+    writer = main.TranscriptWriter()
+    assert asyncio.run(main.cache_get("bad", writer, "t")) is None
+    assert writer.json_size() == 0
+
+
+def test_get_and_put_are_off_when_the_cache_is_disabled(cache_dir, monkeypatch):
+    monkeypatch.setattr(main, "TRANSCRIPT_CACHE_MAX_MB", 0)
+    asyncio.run(main.cache_put("k1", transcript(), META, "t"))
+    assert os.listdir(cache_dir) == []
+    assert asyncio.run(main.cache_get("k1", main.TranscriptWriter(), "t")) is None
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def no_jobs(monkeypatch):
+    monkeypatch.setattr(main, "job_slots", asyncio.Semaphore(1))
+    main.jobs.clear()
+    yield
+    main.jobs.clear()
+
+
+def run_jobs(monkeypatch, pipeline, count=1):
+    monkeypatch.setattr(main, "run_pipeline", pipeline)
+
+    async def scenario():
+        ids = [main.submit_job({"n": i}, f"r{i}")["job_id"] for i in range(count)]
+        await asyncio.gather(*main.job_tasks)
+        return [main.job_view(main.jobs[job_id]) for job_id in ids]
+
+    return asyncio.run(scenario())
+
+
+def test_job_runs_through_queued_running_done(monkeypatch):
+    seen = []
+
+    async def pipeline(data, rid, progress, trace_context=None, interactive=True):
+        [job] = main.jobs.values()
+        seen.append((job["state"], interactive))
+        progress("transcribe", 0.5)
+        seen.append((job["stage"], job["progress"]))
+        return {"duration": 1.0}
+
+    [job] = run_jobs(monkeypatch, pipeline)
+    assert seen == [("running", False), ("transcribe", 0.5)]
+    assert (job["state"], job["stage"], job["progress"], job["result"]) == ("done", "done", 1.0, {"duration": 1.0})
+    assert job["finished_at"] and "_finished_ts" not in job
+
+
+def test_failed_pipeline_records_the_http_error(monkeypatch):
+    async def pipeline(data, rid, progress, trace_context=None, interactive=True):
+        raise HTTPException(status_code=502, detail="Download failed 404")
+
+    [job] = run_jobs(monkeypatch, pipeline)
+    assert job["state"] == "failed"
+    assert job["error"] == {"status_code": 502, "detail": "Download failed 404"}
+
+
+def test_unexpected_error_becomes_internal_error(monkeypatch):
+    async def pipeline(data, rid, progress, trace_context=None, interactive=True):
+        raise RuntimeError("boom")
+
+    [job] = run_jobs(monkeypatch, pipeline)
+    assert job["error"] == {"status_code": 500, "detail": "internal_error"}
+
+
+def test_jobs_wait_for_a_worker(monkeypatch):
+    states = []
+
+    async def pipeline(data, rid, progress, trace_context=None, interactive=True):
+        states.append(sorted(j["state"] for j in main.jobs.values()))
+        await asyncio.sleep(0.01)
+        return {"n": data["n"]}
+
+    jobs = run_jobs(monkeypatch, pipeline, count=2)
+    assert states == [["queued", "running"], ["done", "running"]]
+    assert [job["result"] for job in jobs] == [{"n": 0}, {"n": 1}]
+
+
+def test_full_queue_is_rejected_with_503(monkeypatch):
+    monkeypatch.setattr(main, "JOB_QUEUE_MAX", 1)
+    main.jobs["q"] = {"state": "queued"}
+    with pytest.raises(HTTPException) as exc:
+        main.submit_job({}, "r")
+    assert exc.value.status_code == 503
+
+
+def test_prune_drops_only_expired_finished_jobs(monkeypatch):
+    monkeypatch.setattr(main, "JOB_TTL_SECONDS", 60)
+    now_ts = main.time.time()
+    main.jobs.update({
+        "expired": {"state": "done", "_finished_ts": now_ts - 120},
+        "recent": {"state": "failed", "_finished_ts": now_ts - 10},
+        "running": {"state": "running"},
+    })
+    main.prune_jobs()
+    assert sorted(main.jobs) == ["recent", "running"]
@@ -0,0 +1,45 @@
+import pytest
+
+import main
+
+
+class DummyModel:
+    def __init__(self, name, **kwargs):
+        self.name = name
+
+
+@pytest.fixture(autouse=True)
+def empty_pool(monkeypatch):
+    monkeypatch.setattr(main, "WhisperModel", DummyModel)
+    main.model_pool.clear()
+    yield
+    main.model_pool.clear()
+
+
+def test_per_model_concurrency_overrides_the_default(monkeypatch):
+    monkeypatch.setattr(main, "MODEL_MAX_CONCURRENCY", 2)
+    monkeypatch.setattr(main, "MODEL_CONCURRENCY", {"tiny": 3})
+    for name, limit in (("tiny", 3), ("base", 2)):
+        entry = main.acquire_model(name)
+        main.release_model(entry)
+        acquired = [entry["slots"].acquire(blocking=False) for _ in range(limit + 1)]
+        assert acquired == [True] * limit + [False]
+
+
+def test_idle_models_are_dropped_but_the_default_stays(monkeypatch):
+    monkeypatch.setattr(main, "MODEL_IDLE_SECONDS", 10)
+    for name in (main.WHISPER_MODEL, "tiny", "base"):
+        main.release_model(main.acquire_model(name))
+    main.model_pool["tiny"]["last_used"] -= 60
+    main.model_pool[main.WHISPER_MODEL]["last_used"] -= 60
+    with main.model_pool_lock:
+        main.evict_models(0.0)
+    assert list(main.model_pool) == [main.WHISPER_MODEL, "base"]
+
+
+def test_lru_eviction_makes_room_without_touching_the_default(monkeypatch):
+    monkeypatch.setattr(main, "MODEL_POOL_MAX_MB", 1)
+    for name in (main.WHISPER_MODEL, "tiny"):
+        main.release_model(main.acquire_model(name))
+    main.release_model(main.acquire_model("base"))
+    assert list(main.model_pool) == [main.WHISPER_MODEL, "base"]
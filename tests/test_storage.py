@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import os
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+
+BODY = bytes(range(256)) * 1024  # 256 KiB, four of the 64 KiB chunks sb_iter_bytes reads
+URL = "http://storage.test/storage/v1/object/raw/a.webm"
+
+
+class Dropping(httpx.AsyncByteStream):
+    """Sends the first `cut` bytes of data, then fails like a dropped connection."""
+
+    def __init__(self, data: bytes, cut: int):
+        self.data, self.cut = data, cut
+
+    async def __aiter__(self):
+        yield self.data[:self.cut]
+        raise httpx.ReadError("connection dropped")
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(main, "STORAGE_BACKOFF", 0.0)
+    monkeypatch.setattr(main, "storage_client", None)
+
+
+def serve(handler, coro_fn):
+    async def scenario():
+        main.storage_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await coro_fn()
+        finally:
+            await main.storage_client.aclose()
+            main.storage_client = None
+    return asyncio.run(scenario())
+
+
+def ranged_reply(request, drop_first=()):
+    start, end = request.headers["range"].split("=")[1].split("-")
+    start, end = int(start), int(end) if end else len(BODY) - 1
+    part = BODY[start:end + 1]
+    if start in drop_first:
+        drop_first.remove(start)
+        return httpx.Response(206, stream=Dropping(part, len(part) // 2))
+    return httpx.Response(206, content=part)
+
+
+def test_iter_bytes_resumes_from_the_last_byte_received():
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers["range"])
+        return ranged_reply(request, [0] if len(ranges) == 1 else [])
+
+    async def fetch():
+        tally = {}
+        chunks = [chunk async for chunk in main.sb_iter_bytes(URL, {}, "t", tally=tally)]
+        return b"".join(chunks), tally
+
+    data, tally = serve(handler, fetch)
+    assert data == BODY
+    assert ranges == ["bytes=0-", f"bytes={len(BODY) // 2}-"]
+    assert tally == {"resumes": 1}
+
+
+def test_iter_bytes_gives_up_after_the_resume_budget(monkeypatch):
+    monkeypatch.setattr(main, "DOWNLOAD_RESUME_ATTEMPTS", 2)
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers["range"])
+        return httpx.Response(206, stream=Dropping(BODY, 65536))
+
+    async def fetch():
+        return [chunk async for chunk in main.sb_iter_bytes(URL, {}, "t")]
+
+    with pytest.raises(httpx.ReadError):
+        serve(handler, fetch)
+    assert ranges == ["bytes=0-", "bytes=65536-", "bytes=131072-"]
+
+
+def test_large_objects_download_as_parallel_ranges(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "RANGE_MIN_BYTES", 1024)
+    monkeypatch.setattr(main, "RANGE_PART_BYTES", 131072)
+    ranges, dropped = [], [131072]
+
+    def handler(request):
+        if "range" not in request.headers:
+            return httpx.Response(200, headers={"accept-ranges": "bytes"}, content=BODY)
+        ranges.append(request.headers["range"])
+        return ranged_reply(request, dropped)
+
+    dest = str(tmp_path / "a.webm")
+    digest = serve(handler, lambda: main.sb_download("raw", "a.webm", dest, "t"))
+    assert digest == hashlib.sha256(BODY).hexdigest()
+    with open(dest, "rb") as f:
+        assert f.read() == BODY
+    # Two parts, and the dropped second one resumed from where it stopped
+    assert sorted(ranges) == ["bytes=0-131071", "bytes=131072-262143", "bytes=196608-262143"]
+
+
+def test_failed_part_fails_the_download_and_cancels_the_others(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "RANGE_PART_BYTES", 1024)
+    monkeypatch.setattr(main, "DOWNLOAD_PARALLEL", 2)
+    started = []
+
+    async def handler(request):
+        started.append(request.headers["range"])
+        if request.headers["range"].startswith("bytes=0-"):
+            return httpx.Response(403, content=b"denied")
+        await asyncio.sleep(0.05)
+        return ranged_reply(request)
+
+    async def fetch():
+        try:
+            await main.download_ranges(URL, {}, str(tmp_path / "a.webm"), len(BODY), "t", {})
+        finally:
+            await asyncio.sleep(0.1)  # give cancelled siblings the chance to (wrongly) carry on
+
+    with pytest.raises(HTTPException) as exc:
+        serve(handler, fetch)
+    assert exc.value.status_code == 502
+    assert len(started) < len(BODY) // 1024  # most queued parts never started
+
+
+class TusServer:
+    """Accepts PATCHes at the current offset; fail_at makes the PATCH at that offset store half and fail."""
+
+    def __init__(self, fail_at=(), fail_always=False):
+        self.data = bytearray()
+        self.fail_at = list(fail_at)
+        self.fail_always = fail_always
+        self.patches = []
+
+    def __call__(self, request):
+        if request.method == "POST":
+            return httpx.Response(201, headers={"location": "/storage/v1/upload/resumable/u1"})
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"upload-offset": str(len(self.data))})
+        offset = int(request.headers["upload-offset"])
+        self.patches.append(offset)
+        assert offset == len(self.data)
+        chunk = request.content
+        if self.fail_always or offset in self.fail_at:
+            if offset in self.fail_at:
+                self.fail_at.remove(offset)
+            self.data += chunk[:len(chunk) // 2]
+            return httpx.Response(500)
+        self.data += chunk
+        return httpx.Response(204, headers={"upload-offset": str(len(self.data))})
+
+
+@pytest.fixture
+def tus(monkeypatch):
+    monkeypatch.setattr(main, "TUS_THRESHOLD_BYTES", 1)
+    monkeypatch.setattr(main, "TUS_CHUNK_BYTES", 100_000)
+    monkeypatch.setattr(main, "STORAGE_RETRIES", 0)
+
+
+def test_tus_upload_resumes_from_the_server_offset(tus):
+    server = TusServer(fail_at=[100_000])
+    serve(server, lambda: main.sb_upload("transcripts", "p/transcript.json", BODY, "application/json", "t"))
+    assert bytes(server.data) == BODY
+    # The failed PATCH at 100000 kept 50000 bytes, so the upload carried on from 150000
+    assert server.patches == [0, 100_000, 150_000, 250_000]
+
+
+def test_tus_upload_gives_up_after_the_resume_budget(tus, monkeypatch):
+    monkeypatch.setattr(main, "TUS_RESUME_ATTEMPTS", 2)
+    server = TusServer(fail_always=True)
+    with pytest.raises(HTTPException) as exc:
+        serve(server, lambda: main.sb_upload("transcripts", "p/transcript.json", BODY, "application/json", "t"))
+    assert exc.value.status_code == 502
+    assert len(server.patches) == 3
@@ -0,0 +1,58 @@
+import pytest
+
+import main
+
+SETTINGS = {"max_line_chars": 12, "max_lines": 2, "max_cue_seconds": 6.0}
+
+
+def words(*spec):
+    return [{"word": word, "start": start, "end": end} for word, start, end in spec]
+
+
+def cues(kind, segments, settings=SETTINGS):
+    writer = main.SubtitleWriter(kind, settings)
+    for seg_dict in segments:
+        writer.add(seg_dict)
+    text = writer.encode().read().decode("utf-8")
+    writer.close()
+    return text
+
+
+@pytest.mark.parametrize("kind, seconds, expected", [
+    ("srt", 0.0, "00:00:00,000"),
+    ("srt", 3723.4567, "01:02:03,457"),
+    ("vtt", 59.9996, "00:01:00.000"),
+    ("vtt", -1.0, "00:00:00.000"),
+])
+def test_timestamps(kind, seconds, expected):
+    assert main.SubtitleWriter(kind, SETTINGS).timestamp(seconds) == expected
+
+
+def test_split_wraps_lines_and_starts_a_new_cue_when_full():
+    writer = main.SubtitleWriter("srt", SETTINGS)
+    spec = words((" one", 0.0, 0.5), (" two", 0.5, 1.0), (" three", 1.0, 1.5),
+                 (" four", 1.5, 2.0), (" five", 2.0, 2.5), (" six", 2.5, 3.0))
+    assert [(start, end, [line.strip() for line in lines]) for start, end, lines in writer.split(spec)] == [
+        (0.0, 2.0, ["one two", "three four"]),
+        (2.0, 3.0, ["five six"]),
+    ]
+
+
+def test_split_honours_max_cue_seconds():
+    writer = main.SubtitleWriter("srt", dict(SETTINGS, max_cue_seconds=1.0))
+    spec = words((" a", 0.0, 0.4), (" b", 0.4, 0.9), (" c", 0.9, 1.6))
+    assert [(start, end) for start, end, _ in writer.split(spec)] == [(0.0, 0.9), (0.9, 1.6)]
+
+
+def test_srt_and_vtt_documents():
+    segment = {"start": 1.0, "end": 2.0, "text": " hi there", "words": words((" hi", 1.0, 1.4), (" there", 1.5, 2.0))}
+    assert cues("srt", [segment]) == "1\n00:00:01,000 --> 00:00:02,000\nhi there\n\n"
+    assert cues("vtt", [segment]) == "WEBVTT\n\n00:00:01.000 --> 00:00:02.000\nhi there\n\n"
+
+
+def test_segments_without_words_spread_time_over_characters():
+    timed = main.SubtitleWriter.timed_words({"start": 10.0, "end": 12.0, "text": " ab abcdef"})
+    assert [w["word"] for w in timed] == [" ab", " abcdef"]
+    assert timed[0]["start"] == 10.0 and timed[-1]["end"] == 12.0
+    assert timed[0]["end"] == pytest.approx(10.6)
+
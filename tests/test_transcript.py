@@ -0,0 +1,76 @@
+import io
+import json
+
+import msgpack
+import numpy as np
+import pytest
+
+import main
+
+
+class Recorder:
+    def __init__(self):
+        self.head = None
+        self.segments = []
+
+    def start(self, duration, language):
+        self.head = (duration, language)
+
+    def add(self, seg_dict):
+        self.segments.append(seg_dict)
+
+    def close(self):
+        pass
+
+
+def stored(segments):
+    writer = main.TranscriptWriter()
+    writer.start(12.5, "en")
+    for seg_dict in segments:
+        writer.add(seg_dict)
+    writer.finish()
+    entry = io.BytesIO()
+    writer.copy_to(entry)
+    entry.seek(0)
+    return entry, writer.json_size()
+
+
+@pytest.mark.parametrize("count", [0, 1, 2000])
+def test_replay_streams_every_stored_segment(count):
+    segments = [{"id": i + 1, "start": float(i), "end": i + 0.5, "text": f' "]}}, [{i}" ' * (i % 40 + 1),
+                 "words": [{"word": "é", "start": i + 0.1, "end": i + 0.2}]} for i in range(count)]
+    entry, json_bytes = stored(segments)
+    seen, recorder = [], Recorder()
+    writer = main.TranscriptWriter(on_segment=seen.append, outputs={"rec": recorder})
+    writer.load(entry, json_bytes)
+    writer.replay()
+    assert recorder.head == (12.5, "en")
+    assert recorder.segments == seen == json.loads(writer.json_file.read())["segments"] == segments
+
+
+def test_replay_rejects_a_truncated_transcript():
+    entry, json_bytes = stored([{"id": 1, "start": 0.0, "end": 1.0, "text": " hi"}])
+    writer = main.TranscriptWriter(on_segment=lambda seg_dict: None)
+    writer.load(io.BytesIO(entry.read()[:json_bytes - 5]), json_bytes - 5)
+    with pytest.raises(ValueError):
+        writer.replay()
+
+
+def test_compact_transcript_round_trip():
+    compact = main.CompactTranscript()
+    compact.start(4.5, "en")
+    compact.add({"id": 1, "start": 0.0, "end": 1.5, "text": " hello hello",
+                 "words": [{"word": " hello", "start": 0.0, "end": 0.5}, {"word": " hello", "start": 0.75, "end": 1.5}]})
+    compact.add({"id": 2, "start": 2.0, "end": 4.5, "text": " bye"})
+    doc = msgpack.unpackb(compact.encode(), raw=False)
+
+    f32 = lambda b: np.frombuffer(b, dtype="<f4").tolist()
+    u32 = lambda b: np.frombuffer(b, dtype="<u4").tolist()
+    assert (doc["version"], doc["duration"], doc["language"]) == (1, 4.5, "en")
+    assert doc["strings"] == [" hello hello", " hello", " bye"]
+    assert f32(doc["segments"]["start"]) == [0.0, 2.0]
+    assert f32(doc["segments"]["end"]) == [1.5, 4.5]
+    assert u32(doc["segments"]["text"]) == [0, 2]
+    assert u32(doc["segments"]["word_offsets"]) == [0, 2, 2]
+    assert f32(doc["words"]["start"]) == [0.0, 0.75]
+    assert u32(doc["words"]["text"]) == [1, 1]
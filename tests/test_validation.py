@@ -0,0 +1,77 @@
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+@pytest.mark.parametrize("profile", [["fast"], 5, {"name": "fast"}])
+def test_non_string_profile_is_rejected_with_400(profile):
+    with pytest.raises(HTTPException) as exc:
+        main.resolve_profile({"profile": profile})
+    assert exc.value.status_code == 400
+
+
+def test_known_profile_is_accepted():
+    assert main.resolve_profile({"profile": main.DECODE_PROFILE}) == main.DECODE_PROFILE
+
+
+@pytest.mark.parametrize("formats", [5, [["srt"]], {"srt": True}])
+def test_malformed_formats_are_rejected_with_400(formats):
+    with pytest.raises(HTTPException) as exc:
+        main.resolve_formats({"formats": formats})
+    assert exc.value.status_code == 400
+
+
+def test_formats_accept_list_or_comma_string():
+    assert main.resolve_formats({"formats": "srt, vtt,srt"}) == ["srt", "vtt"]
+    assert main.resolve_formats({"formats": ["msgpack"]}) == ["msgpack"]
+
+
+@pytest.mark.parametrize("priority", [["high"], 8])
+def test_non_string_priority_is_rejected_with_400(priority):
+    tenant = {"priority": "normal", "max_priority": "high"}
+    with pytest.raises(HTTPException) as exc:
+        main.resolve_priority({"priority": priority}, tenant)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("subtitles", [
+    {"max_cue_seconds": "nan"},
+    {"max_cue_seconds": float("inf")},
+    {"max_line_chars": float("inf")},
+    {"max_lines": True},
+    {"max_line_chars": 0},
+    0, "", [], None,
+])
+def test_bad_subtitle_settings_are_rejected_with_400(subtitles):
+    with pytest.raises(HTTPException) as exc:
+        main.resolve_subtitle_settings({"subtitles": subtitles})
+    assert exc.value.status_code == 400
+
+
+def test_subtitle_overrides_are_cast():
+    settings = main.resolve_subtitle_settings({"subtitles": {"max_line_chars": "32", "max_cue_seconds": 4}})
+    assert settings == {"max_line_chars": 32, "max_lines": main.SUBTITLE_MAX_LINES, "max_cue_seconds": 4.0}
+    assert main.resolve_subtitle_settings({})["max_lines"] == main.SUBTITLE_MAX_LINES
+
+
+@pytest.mark.parametrize("vad", [
+    {"threshold": "nan"},
+    {"threshold": 1.5},
+    {"threshold": -0.1},
+    {"threshold": True},
+    {"min_silence_ms": -5},
+    {"speech_pad_ms": "x"},
+    {"speech_pad_ms": float("inf")},
+])
+def test_out_of_range_vad_settings_are_rejected_with_400(vad):
+    with pytest.raises(HTTPException) as exc:
+        main.resolve_decode_options({"vad": vad}, main.DECODE_PROFILE)
+    assert exc.value.status_code == 400
+
+
+def test_vad_overrides_turn_filtering_on():
+    options = main.resolve_decode_options({"vad": {"threshold": "0.3", "min_silence_ms": 0}}, "accurate")
+    assert options["vad_filter"] is True
+    assert options["vad_parameters"]["threshold"] == 0.3
+    assert options["vad_parameters"]["min_silence_duration_ms"] == 0